@@ -1,5 +1,14 @@
-from . import gfd
-from . import gmd
-from . import tex
+import importlib
 
-__all__ = [gfd, gmd, tex]
+__all__ = ['arc', 'gfd', 'gmd', 'tex']
+
+
+def __getattr__(name: str):
+    # Subpackages are imported on first access (PEP 562)
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Optional
+from weakref import WeakKeyDictionary
+
+from . import pipeline
+
+# File I/O runs in the loop's default thread pool, decoding and encoding on
+# the configured executor (threads by default, a ProcessPoolExecutor keeps
+# them off the GIL). At most `limit` calls run at once per event loop.
+# Cancelling a task stops it at the next step, calls not started yet in
+# the executor are dropped.
+_executor: Optional[Executor] = None
+_limit = 8
+_semaphores: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def configure(executor: Optional[Executor] = None, limit: int = 8) -> None:
+    global _executor, _limit
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    _executor = executor
+    _limit = limit
+    _semaphores.clear()
+
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(_limit)
+    return semaphore
+
+
+async def run(func: Callable, *args):
+    # func and args must be picklable with a process executor
+    async with _semaphore():
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, partial(func, *args))
+
+
+async def read(path: str) -> bytes:
+    async with _semaphore():
+        return await asyncio.get_running_loop().run_in_executor(
+            None, pipeline.read_file, path)
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+async def write(path: str, data: bytes) -> None:
+    async with _semaphore():
+        await asyncio.get_running_loop().run_in_executor(
+            None, _write_file, path, data)
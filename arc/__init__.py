@@ -0,0 +1,3 @@
+from .arc import Arc, ArcEntry
+
+__all__ = [Arc, ArcEntry]
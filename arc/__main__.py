@@ -0,0 +1,88 @@
+import argparse
+import os
+from typing import Dict
+
+from .. import profiling
+from .arc import Arc
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m arc',
+    description='List, extract and replace ARC entries.'
+)
+
+profiling.add_arguments(parser)
+
+command_parsers = parser.add_subparsers(title='commands', dest='command',
+                                        help='ARC process')
+list_parser = command_parsers.add_parser('list', help='List ARC entries')
+extract_parser = command_parsers.add_parser('extract',
+                                            help='Extract ARC entries')
+replace_parser = command_parsers.add_parser('replace',
+                                            help='Replace ARC entries')
+
+list_parser.add_argument('arc', metavar='arc_file', type=str, nargs=1,
+                         help='ARC file')
+
+extract_parser.add_argument('arc', metavar='arc_file', type=str, nargs=1,
+                            help='ARC file')
+
+extract_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
+                            help='Output directory', required=True)
+
+replace_parser.add_argument('arc', metavar='arc_file', type=str, nargs=1,
+                            help='Original ARC file')
+
+replace_parser.add_argument('-i', metavar='input_dir', type=str, nargs=1,
+                            help='Directory of files named as entries',
+                            required=True)
+
+replace_parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                            help='Output ARC file', required=True)
+
+
+def list_arc(arc_file: str) -> None:
+    with open(arc_file, 'rb') as f:
+        arc = Arc.load(f)
+    for entry in arc.entries:
+        print(entry)
+
+
+def extract_arc(arc_file: str, out_dir: str) -> None:
+    with open(arc_file, 'rb') as f:
+        arc = Arc.load(f)
+        for entry in arc.entries:
+            out_name = os.path.join(out_dir, *entry.path.split('\\'))
+            os.makedirs(os.path.dirname(out_name), exist_ok=True)
+            with open(out_name, 'wb') as out:
+                out.write(arc.read(entry))
+
+
+def replace_arc(arc_file: str, in_dir: str, out_file: str) -> None:
+    with open(arc_file, 'rb') as f:
+        arc = Arc.load(f)
+
+        replaced: Dict[str, bytes] = dict()
+        for entry in arc.entries:
+            in_name = os.path.join(in_dir, *entry.path.split('\\'))
+            if not os.path.isfile(in_name):
+                in_name = os.path.join(in_dir, entry.base_name)
+            if not os.path.isfile(in_name):
+                continue
+            with open(in_name, 'rb') as entry_file:
+                replaced[entry.path] = entry_file.read()
+            print(entry.path)
+
+        arc.save(out_file, replaced)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    with profiling.session(args):
+        if args.command == 'list':
+            list_arc(args.arc[0])
+        elif args.command == 'extract':
+            extract_arc(args.arc[0], args.o[0])
+        elif args.command == 'replace':
+            replace_arc(args.arc[0], args.i[0], args.o[0])
+        else:
+            parser.print_help()
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from io import BufferedReader, BytesIO
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+# Type hashes of the resources handled by this package
+EXTENSIONS = {
+    0x242BB29A: 'gmd',  # rGUIMessage
+    0x2D462600: 'gfd',  # rGUIFont
+    0x241F5DEB: 'tex',  # rTexture
+}
+
+
+class ArcEntry(object):
+    SIZE_MASK = 0x1FFFFFFF
+
+    def __init__(self,
+                 name: str,
+                 ext_hash: int,
+                 comp_size: int,
+                 size_field: int,
+                 offset: int) -> None:
+        self.name = name
+        self.ext_hash = ext_hash
+        self.comp_size = comp_size
+        self.size = size_field & ArcEntry.SIZE_MASK
+        self.size_flags = size_field & ~ArcEntry.SIZE_MASK
+        self.offset = offset
+
+    @property
+    def ext(self) -> str:
+        return EXTENSIONS.get(self.ext_hash, f"{self.ext_hash:08x}")
+
+    @property
+    def path(self) -> str:
+        return f"{self.name}.{self.ext}"
+
+    @property
+    def base_name(self) -> str:
+        return self.path.replace('\\', '/').split('/')[-1]
+
+    @staticmethod
+    def load(data: bytes) -> ArcEntry:
+        name, *fields = struct.unpack('<64s4I', data)
+        return ArcEntry(name.split(b'\x00')[0].decode('UTF-8'), *fields)
+
+    def dump(self) -> bytes:
+        return struct.pack('<64s4I',
+                           self.name.encode('UTF-8'),
+                           self.ext_hash,
+                           self.comp_size,
+                           self.size | self.size_flags,
+                           self.offset)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.path}:"
+            f" {self.comp_size} -> {self.size}"
+            f" @ {self.offset:#x}"
+        )
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class Arc(object):
+    class _Header(object):
+        def __init__(self,
+                     magic: bytes,
+                     version: int,
+                     entry_count: int) -> None:
+            self.magic = magic
+            self.version = version
+            self.entry_count = entry_count
+
+        @staticmethod
+        def load(data: bytes) -> Arc._Header:
+            return Arc._Header(*struct.unpack('<4s2H', data))
+
+        def dump(self) -> bytes:
+            return struct.pack('<4s2H',
+                               self.magic, self.version, self.entry_count)
+
+    def __init__(self) -> None:
+        self.header = None
+        self.entries: List[ArcEntry] = list()
+        self.__f: Optional[BinaryIO] = None
+
+    @staticmethod
+    def load(f: BufferedReader) -> Arc:
+        # Table of contents only, entries are read from f on demand
+        arc = Arc()
+        arc.__f = f
+        arc.header = Arc._Header.load(f.read(8))
+        assert arc.header.magic == b'ARC\x00'
+
+        toc = f.read(80 * arc.header.entry_count)
+        arc.entries = [
+            ArcEntry.load(toc[i:i+80]) for i in range(0, len(toc), 80)
+        ]
+        return arc
+
+    def find(self, path: str) -> Optional[ArcEntry]:
+        for entry in self.entries:
+            if path in (entry.path, entry.base_name):
+                return entry
+        return None
+
+    def iter_raw(self, entry: ArcEntry,
+                 chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        self.__f.seek(entry.offset)
+        remain = entry.comp_size
+        while remain > 0:
+            chunk = self.__f.read(min(chunk_size, remain))
+            if not chunk:
+                raise ValueError(f"Truncated entry {entry.path}")
+            remain -= len(chunk)
+            yield chunk
+
+    def open(self, entry: ArcEntry) -> BytesIO:
+        out = BytesIO()
+        if entry.comp_size == entry.size:
+            # Stored without compression
+            for chunk in self.iter_raw(entry):
+                out.write(chunk)
+        else:
+            decomp = zlib.decompressobj()
+            for chunk in self.iter_raw(entry):
+                out.write(decomp.decompress(chunk))
+            out.write(decomp.flush())
+
+        if out.tell() != entry.size:
+            raise ValueError(f"Size mismatch in {entry.path}")
+        out.seek(0)
+        return out
+
+    def read(self, entry: ArcEntry) -> bytes:
+        return self.open(entry).getvalue()
+
+    def save(self, arc_file: str, replaced: Dict[str, bytes] = None,
+             level: int = zlib.Z_DEFAULT_COMPRESSION) -> None:
+        # Entries not in replaced (by path) are copied still compressed
+        if replaced is None:
+            replaced = dict()
+
+        data_offset = 8 + 80 * len(self.entries)
+        if len(self.entries) > 0:
+            data_offset = max(data_offset,
+                              min(e.offset for e in self.entries))
+
+        entries: List[ArcEntry] = list()
+        blobs: List[Optional[bytes]] = list()
+        offset = data_offset
+        for entry in self.entries:
+            new_entry = ArcEntry(entry.name, entry.ext_hash,
+                                 entry.comp_size, entry.size, offset)
+            new_entry.size_flags = entry.size_flags
+
+            blob = replaced.get(entry.path)
+            if blob is not None:
+                new_entry.size = len(blob)
+                blob = zlib.compress(blob, level)
+                new_entry.comp_size = len(blob)
+
+            entries.append(new_entry)
+            blobs.append(blob)
+            offset += new_entry.comp_size
+
+        # Written next to arc_file first, which may be the source archive
+        with open(arc_file + '.tmp', 'wb') as f:
+            f.write(self.header.dump())
+            for entry in entries:
+                f.write(entry.dump())
+            f.write(b'\x00' * (data_offset - f.tell()))
+
+            for entry, new_entry, blob in zip(self.entries, entries, blobs):
+                if blob is not None:
+                    f.write(blob)
+                    continue
+                for chunk in self.iter_raw(entry):
+                    f.write(chunk)
+        os.replace(arc_file + '.tmp', arc_file)
@@ -0,0 +1,3 @@
+from .cases import Case, all_cases
+
+__all__ = [Case, all_cases]
@@ -0,0 +1,144 @@
+import argparse
+import fnmatch
+import json
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+from .cases import Case, all_cases
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m bench',
+    description='Benchmark the codecs on synthetic data.'
+)
+
+command_parsers = parser.add_subparsers(title='commands', dest='command',
+                                        help='Benchmark process')
+run_parser = command_parsers.add_parser('run', help='Run benchmarks')
+list_parser = command_parsers.add_parser('list', help='List benchmarks')
+
+run_parser.add_argument('-k', metavar='pattern', type=str, nargs=1,
+                        help='Only run cases matching the glob pattern')
+
+run_parser.add_argument('--quick', action='store_true',
+                        help='Only run the smallest size of each case')
+
+run_parser.add_argument('--min-time', metavar='seconds', type=float,
+                        default=0.5, help='Minimum time spent on each case')
+
+run_parser.add_argument('-b', metavar='baseline_file', type=str, nargs=1,
+                        help='Baseline JSON to compare with')
+
+run_parser.add_argument('-t', metavar='threshold', type=float, default=0.2,
+                        help='Slowdown ratio flagged as regression')
+
+run_parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                        help='Save results as baseline JSON')
+
+
+def select_cases(pattern: str = None, quick: bool = False) -> List[Case]:
+    cases = all_cases()
+    if quick:
+        seen = set()
+        cases = [c for c in cases
+                 if not (c.name in seen or seen.add(c.name))]
+    if pattern is not None:
+        cases = [c for c in cases if fnmatch.fnmatch(c.key, pattern)]
+    return cases
+
+
+def measure(case: Case, min_time: float) -> Dict[str, float]:
+    arg = case.setup(case.size)
+
+    best = float('inf')
+    runs = 0
+    start = time.perf_counter()
+    while runs == 0 or time.perf_counter() - start < min_time:
+        t = time.perf_counter()
+        case.run(arg)
+        best = min(best, time.perf_counter() - t)
+        runs += 1
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    case.run(arg)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    amount = case.amount(arg)
+    return {
+        'seconds': best,
+        'runs': runs,
+        'amount': amount,
+        'unit': case.unit,
+        'throughput': amount / best if best > 0 else 0.0,
+        'peak_bytes': peak
+    }
+
+
+def _human(value: float, unit: str = '') -> str:
+    for prefix in ['', 'k', 'M', 'G']:
+        if abs(value) < 1000:
+            return f"{value:.1f} {prefix}{unit}"
+        value /= 1000
+    return f"{value:.1f} T{unit}"
+
+
+def run_cases(cases: List[Case], min_time: float = 0.5,
+              baseline_file: str = None, threshold: float = 0.2,
+              out_file: str = None) -> int:
+    baseline: Dict[str, Dict[str, float]] = dict()
+    if baseline_file is not None:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)['results']
+
+    results: Dict[str, Dict[str, float]] = dict()
+    regressions = 0
+    for case in cases:
+        result = measure(case, min_time)
+        results[case.key] = result
+
+        line = (
+            f"{case.key:<28}"
+            f" {result['seconds'] * 1000:>10.2f} ms"
+            f" {_human(result['throughput'], case.unit + '/s'):>16}"
+            f" {_human(result['peak_bytes'], 'B'):>10}"
+        )
+        base = baseline.get(case.key)
+        if base is not None:
+            ratio = result['seconds'] / base['seconds'] - 1
+            line += f" {ratio:+7.1%}"
+            if ratio > threshold:
+                line += ' REGRESSION'
+                regressions += 1
+        print(line)
+
+    if out_file is not None:
+        with open(out_file, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'results': results
+            }, f, indent=2)
+
+    if regressions > 0:
+        print(f"{regressions} regressions over {threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.command == 'run':
+        regressions = run_cases(
+            select_cases(args.k[0] if args.k else None, args.quick),
+            min_time=args.min_time,
+            baseline_file=args.b[0] if args.b else None,
+            threshold=args.t,
+            out_file=args.o[0] if args.o else None
+        )
+        sys.exit(1 if regressions > 0 else 0)
+    elif args.command == 'list':
+        for case in select_cases():
+            print(case.key)
+    else:
+        parser.print_help()
@@ -0,0 +1,215 @@
+import os
+import random
+import subprocess
+import sys
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Tuple
+
+from PIL import ImageFont
+
+from ..gfd.font_bitmap import FontBitmap
+from ..gfd.gfd import GFD
+from ..gmd.crc32 import Crc32
+from ..gmd.gmd import GMD, GMDSection
+from ..gmd.xor import XOR
+from ..tex import MTTex
+from ..tex.img_util import la04_encode, la04_loader
+from ..tex.swizzle import ctr_swizzle
+from . import synth
+
+
+class Case(object):
+    def __init__(self,
+                 name: str,
+                 size: Any,
+                 setup: Callable[[Any], Any],
+                 run: Callable[[Any], Any],
+                 amount: Callable[[Any], int],
+                 unit: str) -> None:
+        self.name = name
+        self.size = size
+        self.setup = setup
+        self.run = run
+        self.amount = amount
+        self.unit = unit
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+
+def _load_gmd(blob: bytes) -> GMD:
+    return GMD.load(BytesIO(blob))
+
+
+def _repack(gmd: GMD, changes: Dict[int, bytes] = None) -> bytes:
+    # Same steps as unpack then repack, section texts replaced by id
+    changes = changes if changes is not None else dict()
+    repacked = GMD()
+    repacked.name = gmd.name
+    repacked.padding = gmd.padding
+    for s in gmd.sections:
+        repacked.add_section(
+            GMDSection(s.id, s.name, changes.get(s.id, s.text)))
+    return repacked.to_bytes()
+
+
+def _repack_gmd(blob: bytes) -> bytes:
+    # Unpack and repack, which must give back the same bytes
+    gmd = _load_gmd(blob)
+    result = _repack(gmd)
+    if result != blob:
+        raise RuntimeError(f"{gmd.name}: repack differs from the source")
+    return result
+
+
+def _patch_gmd(blob: bytes) -> bytes:
+    # Patching the last section must give the same bytes as a full repack
+    gmd = _load_gmd(blob)
+    changes = {len(gmd.sections) - 1: b'patched\nline'}
+    result = GMD.patch(blob, changes)
+    if result != _repack(gmd, changes):
+        raise RuntimeError(f"{gmd.name}: patch differs from a repack")
+    return result
+
+
+def _load_tex(blob: bytes) -> MTTex:
+    return MTTex.load(BytesIO(blob))
+
+
+def _load_gfd(blob: bytes) -> GFD:
+    return GFD.load(BytesIO(blob))
+
+
+def _make_assets(n: int) -> Tuple[List[bytes], List[bytes]]:
+    # n GMDs of 400 sections and n // 10 GFDs of 7000 glyphs
+    gmds = [synth.make_gmd(400)] * n
+    gfds = [synth.make_gfd(7000)] * max(n // 10, 1)
+    return gmds, gfds
+
+
+def _load_assets(blobs: Tuple[List[bytes], List[bytes]]) -> List[Any]:
+    # Everything stays loaded, so peak memory includes all the records
+    gmds, gfds = blobs
+    return [_load_gmd(blob) for blob in gmds] + \
+        [_load_gfd(blob) for blob in gfds]
+
+
+def _fill_bitmap(font: ImageFont.ImageFont) -> FontBitmap:
+    bitmap = FontBitmap()
+    code = 0x21
+    while not bitmap.full:
+        bitmap.push(chr(code), 0, font)
+        code = code + 1 if code < 0x7e else 0x21
+    return bitmap
+
+
+_PACKAGE = __package__.rpartition('.')[0]
+_PACKAGE_PARENT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_module(target: Tuple[str, List[str]]) -> None:
+    # Fresh interpreter, fails if a dependency is pulled in eagerly
+    module, forbidden = target
+    code = (
+        f"import sys, {_PACKAGE}.{module}\n"
+        f"loaded = [m for m in {forbidden!r} if m in sys.modules]\n"
+        f"sys.exit(', '.join(loaded) or None)"
+    )
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [_PACKAGE_PARENT] + [p for p in [env.get('PYTHONPATH')] if p])
+    result = subprocess.run([sys.executable, '-c', code], env=env,
+                            stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module}: {result.stderr.strip()}")
+
+
+def _pixels(size: int) -> int:
+    return size * size
+
+
+GMD_SIZES = [10, 1000, 20000]
+TEXT_SIZES = [1 << 16, 1 << 20]
+TEX_SIZES = [256, 512, 1024]
+GFD_SIZES = [7000]
+# Modules, and what they must not import
+IMPORTS = {
+    'gmd': ['PIL', 'bidict'],
+    'font_db': ['PIL', 'bidict'],
+    'tex': ['PIL'],
+    'gfd': ['PIL'],
+}
+
+
+def all_cases() -> List[Case]:
+    cases: List[Case] = list()
+
+    for module, forbidden in IMPORTS.items():
+        cases.append(Case('import', module,
+                          lambda module: (module, IMPORTS[module]),
+                          _import_module, lambda target: 1, 'imports'))
+
+    for n in TEXT_SIZES:
+        cases.append(Case(
+            'xor.rexor', n,
+            lambda n: synth.make_text(random.Random(0), n // 3),
+            XOR.rexor, len, 'B'))
+        cases.append(Case(
+            'xor.dexor', n,
+            lambda n: XOR.rexor(
+                synth.make_text(random.Random(0), n // 3) + b'\x00'),
+            XOR.dexor, len, 'B'))
+
+    cases.append(Case(
+        'crc32.create', 10000,
+        lambda n: [f"MSG_{i:05d}" for i in range(n)],
+        lambda names: [Crc32.create(name) for name in names],
+        len, 'labels'))
+
+    for n in GMD_SIZES:
+        cases.append(Case('gmd.load', n, synth.make_gmd, _load_gmd,
+                          len, 'B'))
+        cases.append(Case('gmd.pack', n,
+                          lambda n: _load_gmd(synth.make_gmd(n)),
+                          GMD.to_bytes,
+                          lambda gmd: len(gmd.sections), 'sections'))
+        # Every third section unlabeled, as in some menu texts
+        cases.append(Case('gmd.repack', n,
+                          lambda n: synth.make_gmd(n, unlabeled=3),
+                          _repack_gmd, len, 'B'))
+        cases.append(Case('gmd.patch_repack', n,
+                          lambda n: synth.make_gmd(n, bare_newlines=True),
+                          _patch_gmd, len, 'B'))
+        cases.append(Case('gmd.patch', n, synth.make_gmd,
+                          lambda blob, n=n: GMD.patch(
+                              blob, {str(n // 2): b'patched'}),
+                          len, 'B'))
+
+    for n in TEX_SIZES:
+        cases.append(Case('tex.swizzle', n, lambda n: n,
+                          lambda n: ctr_swizzle.__wrapped__(n, n),
+                          _pixels, 'px'))
+        cases.append(Case('tex.la04_loader', n,
+                          lambda n: synth.make_tex((n, n))[20:],
+                          la04_loader, lambda blob: len(blob) * 2, 'px'))
+        cases.append(Case('tex.la04_encode', n,
+                          lambda n: synth.make_bmp((n, n)),
+                          la04_encode, len, 'px'))
+        cases.append(Case('tex.load', n,
+                          lambda n: synth.make_tex((n, n)),
+                          _load_tex, lambda blob: len(blob) * 2, 'px'))
+
+    for n in GFD_SIZES:
+        cases.append(Case('gfd.load', n, synth.make_gfd, _load_gfd,
+                          lambda blob: len(blob) // 20, 'glyphs'))
+
+    cases.append(Case('load.all', 50, _make_assets, _load_assets,
+                      lambda blobs: len(blobs[0]) + len(blobs[1]), 'files'))
+
+    cases.append(Case('font_bitmap.push', FontBitmap.capacity(),
+                      lambda n: ImageFont.load_default(), _fill_bitmap,
+                      lambda font: FontBitmap.capacity(), 'glyphs'))
+
+    return cases
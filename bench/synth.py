@@ -0,0 +1,78 @@
+import random
+from typing import List, Tuple
+
+from ..gfd.gfd import GFD
+from ..gfd.glyph_entry import GlyphEntry
+from ..gmd.gmd import GMD, GMDSection
+from ..gmd.xor import XOR
+from ..tex import MTTex
+
+# Kana, punctuation and common kanji, as in the game scripts
+_CHARS = (
+    [chr(c) for c in range(0x3041, 0x3097)] +
+    [chr(c) for c in range(0x30a1, 0x30fb)] +
+    [chr(c) for c in range(0x4e00, 0x4e00 + 2000)] +
+    list('、。！？「」…―\n')
+)
+
+
+def make_text(rng: random.Random, length: int) -> bytes:
+    return ''.join(rng.choices(_CHARS, k=length)).encode('UTF-8')
+
+
+def make_gmd(section_count: int, seed: int = 0, unlabeled: int = 0,
+             bare_newlines: bool = False) -> bytes:
+    # With unlabeled > 0, every unlabeled-th section has no label. Packed
+    # texts have \r\n line breaks, or \n as in some game files
+    rng = random.Random(seed)
+    gmd = GMD()
+    gmd.name = f"bench_{section_count}"
+    no_name_count = 0
+    for i in range(section_count):
+        text = make_text(rng, rng.randint(10, 120))
+        if unlabeled > 0 and i % unlabeled == 0:
+            name = f"no_name_{no_name_count}"
+            no_name_count += 1
+        else:
+            name = f"MSG_{i:05d}"
+        gmd.add_section(GMDSection(i, name, text))
+    blob = gmd.to_bytes()
+    if not bare_newlines:
+        return blob
+
+    header = GMD._Header.load(blob)
+    text_offset = len(blob) - header.section_size
+    raw_text = XOR.dexor(blob[text_offset:]).replace(b'\r\n', b'\n')
+    header.section_size = len(raw_text)
+    return header.dump() + blob[40:text_offset] + XOR.rexor(raw_text)
+
+
+def make_bmp(size: Tuple[int, int],
+             seed: int = 0) -> List[Tuple[int, int, int, int]]:
+    rng = random.Random(seed)
+    # LA4 keeps the upper nibble only
+    return [(255, 255, 255, rng.randrange(16) * 17)
+            for _ in range(size[0] * size[1])]
+
+
+def make_tex(size: Tuple[int, int], seed: int = 0) -> bytes:
+    return MTTex.new(size, make_bmp(size, seed)).to_bytes()
+
+
+def make_gfd(glyph_count: int, size_px: int = 18) -> bytes:
+    name = f"bench_{glyph_count}"
+    gfd = GFD()
+    gfd.name = name
+    gfd.header = GFD._Header(b'GFD\x00', b'\x00\x01\x01\x00', bytes(12),
+                             size_px, 0, glyph_count, bytes(28), len(name))
+
+    glyphs: List[GlyphEntry] = list()
+    for i in range(glyph_count):
+        tex, cell = divmod(i, 625)
+        y, x = divmod(cell, 25)
+        glyphs.append(GlyphEntry(chr(0x4e00 + i), tex,
+                                 (x * 20, y * 20), (18, 18), (18, 16),
+                                 (0, 0), 20))
+    gfd.glyphs = glyphs
+    gfd.header.bitmap_count = glyphs[-1].tex + 1
+    return gfd.to_bytes()
@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from .gfd.gfd import GFD
+from .gmd.gmd import GMD
+from .tex.mt_tex import MTTex
+
+DEFAULT_LIMIT = 512 << 20
+
+
+def footprint(obj: object, samples: int = 32) -> int:
+    # Approximate deep size in bytes, long sequences are sampled
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (bytes, str, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, dict):
+        return size + sum(footprint(k, samples) + footprint(v, samples)
+                          for k, v in obj.items())
+
+    if isinstance(obj, (list, tuple, set)):
+        items = list(obj)
+        if len(items) <= samples:
+            return size + sum(footprint(i, samples) for i in items)
+        step = len(items) / samples
+        sampled = sum(footprint(items[int(k * step)], samples)
+                      for k in range(samples))
+        return size + sampled * len(items) // samples
+
+    if hasattr(obj, '__dict__'):
+        size += footprint(vars(obj), samples)
+    for name in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, name):
+            size += footprint(getattr(obj, name), samples)
+    return size
+
+
+class ObjectCache(object):
+    def __init__(self, limit: int = DEFAULT_LIMIT) -> None:
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.used = 0
+        self.__lock = threading.Lock()
+        # (loader, path) -> ((mtime, size), object, footprint)
+        self.__entries: OrderedDict = OrderedDict()
+
+    def get(self, path: str, loader: Callable) -> object:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = (loader, path)
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Loaded outside the lock, other files stay available meanwhile
+        with open(path, 'rb') as f:
+            obj = loader(f)
+        size = footprint(obj)
+
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.used -= old[2]
+            self.__entries[key] = (version, obj, size)
+            self.used += size
+            self.__evict()
+        return obj
+
+    def __evict(self) -> None:
+        # The most recent entry stays even if it is over the limit alone
+        while self.used > self.limit and len(self.__entries) > 1:
+            _, (_, _, evicted) = self.__entries.popitem(last=False)
+            self.used -= evicted
+            self.evictions += 1
+
+    def set_limit(self, limit: int) -> None:
+        with self.__lock:
+            self.limit = limit
+            self.__evict()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.used = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.__entries),
+                'bytes': self.used,
+                'limit': self.limit
+            }
+
+
+_cache = ObjectCache()
+
+
+# Objects returned by the open_* helpers are shared between callers, copy
+# them before modifying
+def open_gmd(path: str) -> GMD:
+    return _cache.get(path, GMD.load)
+
+
+def open_gfd(path: str) -> GFD:
+    return _cache.get(path, GFD.load)
+
+
+def open_tex(path: str) -> MTTex:
+    return _cache.get(path, MTTex.load)
+
+
+def set_limit(limit: int) -> None:
+    _cache.set_limit(limit)
+
+
+def stats() -> Dict[str, int]:
+    return _cache.stats()
+
+
+def clear() -> None:
+    _cache.clear()
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import pipeline
+from .gmd.texts import UNDECODABLE, read_texts
+
+
+def file_hash(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _stat_file(path: str, known_hash: Optional[str]) \
+        -> Tuple[str, float, int, str, bool]:
+    stat = os.stat(path)
+    digest = file_hash(path)
+    return path, stat.st_mtime, stat.st_size, digest, digest != known_hash
+
+
+def _count_file(data: Tuple[str, float, int, str, bool]) \
+        -> Tuple[float, int, str, Optional[Counter]]:
+    path, mtime, size, digest, changed = data
+    if not changed:
+        return mtime, size, digest, None
+
+    counter: Counter = Counter()
+    for text in read_texts(path, chunk_size=1 << 20):
+        counter.update(text)
+    for char in '\r\n' + UNDECODABLE:
+        del counter[char]
+    return mtime, size, digest, counter
+
+
+class CharIndex(object):
+    def __init__(self, db_file: str) -> None:
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chars (
+                code INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (code, path)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS chars_path ON chars (path);
+        ''')
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def update(self, text_dir: str, jobs: int = 1, readers: int = 4,
+               depth: int = 16) -> Tuple[int, int, int]:
+        # Returns numbers of (recounted, unchanged, removed) files
+        root = os.path.join(os.path.abspath(text_dir), '')
+        known: Dict[str, Tuple[float, int, str]] = {
+            path: (mtime, size, digest)
+            for path, mtime, size, digest in self.conn.execute(
+                'SELECT path, mtime, size, hash FROM files'
+                ' WHERE substr(path, 1, ?) = ?', (len(root), root))
+        }
+
+        files = pipeline.find_files(os.path.abspath(text_dir),
+                                    ('.gmd', '.gmd.jsonl', '.txt'))
+        stale: List[str] = list()
+        for path in files:
+            stat = os.stat(path)
+            if known.get(path, (None, None))[:2] != \
+                    (stat.st_mtime, stat.st_size):
+                stale.append(path)
+
+        def read(path: str) -> Tuple[str, float, int, str, bool]:
+            return _stat_file(path, known[path][2] if path in known else None)
+
+        removed = set(known.keys()).difference(files)
+        recounted = 0
+        with self.conn:
+            for path in removed:
+                self.conn.execute('DELETE FROM chars WHERE path = ?', (path,))
+                self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+
+            for path, (mtime, size, digest, counter) in pipeline.imap(
+                    stale, read, _count_file,
+                    jobs=jobs, readers=readers, depth=depth):
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                    (path, mtime, size, digest))
+                if counter is None:
+                    continue
+                recounted += 1
+                self.conn.execute('DELETE FROM chars WHERE path = ?', (path,))
+                self.conn.executemany(
+                    'INSERT INTO chars VALUES (?, ?, ?)',
+                    ((ord(c), path, n) for c, n in counter.items()))
+
+        return recounted, len(files) - recounted, len(removed)
+
+    def codes(self) -> Iterator[int]:
+        # Sorted by the primary key, no extra sort pass
+        for code, in self.conn.execute(
+                'SELECT DISTINCT code FROM chars ORDER BY code'):
+            yield code
+
+    def frequencies(self) -> List[Tuple[int, int]]:
+        return self.conn.execute(
+            'SELECT code, SUM(count) AS total FROM chars'
+            ' GROUP BY code ORDER BY total DESC, code').fetchall()
+
+
+def dump_codes(codes: Iterable[int], out_file: str) -> int:
+    # Writes a JSON list while iterating
+    total = 0
+    with open(out_file, 'w') as f:
+        f.write('[')
+        for code in codes:
+            if total > 0:
+                f.write(', ')
+            f.write(str(code))
+            total += 1
+        f.write(']')
+    return total
+
+
+def _read_codes(list_file: str, chunk_size: int = 1 << 16) \
+        -> Iterator[int]:
+    # Integers of a JSON list, read in chunks
+    with open(list_file, 'r', encoding='UTF-8') as f:
+        rest = ''
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            parts = (rest + chunk).split(',')
+            rest = parts.pop()
+            for part in parts:
+                yield int(part.strip(' \t\r\n[]'))
+        rest = rest.strip(' \t\r\n[]')
+        if rest:
+            yield int(rest)
+
+
+def iter_codes(list_file: str) -> Iterator[int]:
+    # Sorted lists are streamed, checked in a first pass over the file
+    last = -1
+    for code in _read_codes(list_file):
+        if code < last:
+            # Layout lists are not in codepoint order, sorted in memory
+            return iter(sorted(_read_codes(list_file)))
+        last = code
+    return _read_codes(list_file)
@@ -2,32 +2,53 @@
 
 import argparse
 import csv
-import glob
+import heapq
 import json
-from typing import List, Set
+from collections import Counter
+from functools import partial
+from typing import Dict, Iterator, List, Set, Tuple
+
+from . import pipeline, profiling
+from .char_index import CharIndex, dump_codes, iter_codes
+from .gfd.font_bitmap import FontBitmap
+from .gmd.texts import UNDECODABLE, find_sources, read_texts
 
 parser = argparse.ArgumentParser(
     prog='font_db.py',
     description='Process list of font characters.'
 )
 
+profiling.add_arguments(parser)
+
 command_parsers = parser.add_subparsers(title='commands', dest='command',
                                         help='Font list process')
 
-count_cmd = command_parsers.add_parser('count',
-                                       help='Count characters from text files')
+count_cmd = command_parsers.add_parser(
+    'count', help='Count characters from text or GMD files')
 
 from_csv = command_parsers.add_parser('from_csv',
                                       help='Generate font list from CSV')
 
 merge_cmd = command_parsers.add_parser('merge', help='Merge lists')
 
+export_cmd = command_parsers.add_parser(
+    'export', help='Export font list from character index')
+
+layout_cmd = command_parsers.add_parser(
+    'layout', help='Order a font list by character frequency')
+
 count_cmd.add_argument('-d', metavar='text_dir', type=str, nargs=1,
-                       help='Texts directory', required=True)
+                       help='Texts or GMD files directory', required=True)
 
 count_cmd.add_argument('-o', metavar='output_file', type=str, nargs=1,
                        help='Output JSON file', required=True)
 
+count_cmd.add_argument('--freq', metavar='freq_file', type=str, nargs=1,
+                       help='Output JSON file of character frequencies')
+
+count_cmd.add_argument('--index', metavar='index_file', type=str, nargs=1,
+                       help='Character index to update incrementally')
+
 from_csv.add_argument('-i', metavar='csv_file', type=str, nargs=1,
                       help='CSV file', required=True)
 
@@ -40,24 +61,76 @@ merge_cmd.add_argument('files', metavar='file', type=str, nargs='+',
 merge_cmd.add_argument('-o', metavar='output_file', type=str, nargs=1,
                        help='Merged JSON file', required=True)
 
+export_cmd.add_argument('--index', metavar='index_file', type=str, nargs=1,
+                        help='Character index', required=True)
 
-def count_from_dir(text_dir: str, out_file: str):
-    char_set: Set[int] = set()
+export_cmd.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                        help='Output JSON file', required=True)
 
-    txt_files = glob.glob(f"{text_dir}/**/*.txt")
+export_cmd.add_argument('--freq', metavar='freq_file', type=str, nargs=1,
+                        help='Output JSON file of character frequencies')
 
-    for file in txt_files:
-        with open(file, 'r', encoding='UTF-8') as f:
-            for char in f.read():
-                char_set.add(ord(char))
+layout_cmd.add_argument('-d', metavar='text_dir', type=str, nargs=1,
+                        help='Texts or GMD files directory', required=True)
+
+layout_cmd.add_argument('-l', metavar='list_file', type=str, nargs=1,
+                        help='Font list JSON file', required=True)
+
+layout_cmd.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                        help='Output layout JSON file', required=True)
+
+pipeline.add_arguments(count_cmd)
+pipeline.add_arguments(layout_cmd)
+
+
+def count_source(source: str) -> Counter:
+    counter: Counter = Counter()
+    for text in read_texts(source, chunk_size=1 << 20):
+        counter.update(text)
+    return counter
 
-    if 0xa in char_set:
-        char_set.remove(0xa)
-    char_list = sorted(list(char_set))
+
+def count_texts(text_dir: str, jobs: int = 1, readers: int = 4,
+                depth: int = 16) -> Counter:
+    sources = find_sources(text_dir)
+    counter: Counter = Counter()
+
+    for _, result in pipeline.imap(sources, None, count_source, jobs=jobs,
+                                   readers=readers, depth=depth):
+        counter.update(result)
+
+    # GMD texts keep CRLF line breaks, bytes that are not UTF-8 are no
+    # characters
+    for char in '\r\n' + UNDECODABLE:
+        del counter[char]
+    return counter
+
+
+def count_from_dir(text_dir: str, out_file: str,
+                   freq_file: str = None, index_file: str = None,
+                   jobs: int = 1, readers: int = 4, depth: int = 16):
+    if index_file is not None:
+        index = CharIndex(index_file)
+        try:
+            recounted, unchanged, removed = index.update(
+                text_dir, jobs=jobs, readers=readers, depth=depth)
+            print(f"Recounted: {recounted}, unchanged: {unchanged}"
+                  f", removed: {removed}")
+        finally:
+            index.close()
+        export_index(index_file, out_file, freq_file)
+        return
+
+    counter = count_texts(text_dir, jobs=jobs, readers=readers, depth=depth)
+    char_list = sorted(ord(c) for c in counter)
 
     with open(out_file, 'w') as f:
         json.dump(char_list, f)
 
+    if freq_file is not None:
+        with open(freq_file, 'w') as f:
+            json.dump([[ord(c), n] for c, n in counter.most_common()], f)
+
     print(f"Total: {len(char_list)}")
 
 
@@ -79,30 +152,98 @@ def csv_to_txt(csv_file: str, out_file: str):
 
 
 def merge_lists(files: List[str], out_file: str):
-    char_set: Set[int] = set()
+    def unique(codes: Iterator[int]) -> Iterator[int]:
+        last = None
+        for code in codes:
+            if code != last and code != 0xa:
+                yield code
+            last = code
+
+    merged = heapq.merge(*[iter_codes(file) for file in files])
+    total = dump_codes(unique(merged), out_file)
+
+    print(f"Total: {total}")
+
+
+def export_index(index_file: str, out_file: str, freq_file: str = None):
+    index = CharIndex(index_file)
+    try:
+        total = dump_codes(index.codes(), out_file)
+        if freq_file is not None:
+            with open(freq_file, 'w') as f:
+                json.dump(index.frequencies(), f)
+    finally:
+        index.close()
+
+    print(f"Total: {total}")
+
+
+def count_line_pages(source: str,
+                     page_maps: List[Dict[int, int]]) -> Tuple[int, ...]:
+    # Number of lines, then distinct pages touched for each page map
+    totals = [0] * (len(page_maps) + 1)
+    for text in read_texts(source):
+        for line in text.splitlines():
+            codes = {ord(c) for c in line}
+            if not codes:
+                continue
+            totals[0] += 1
+            for i, page_map in enumerate(page_maps):
+                totals[i + 1] += len({page_map.get(c) for c in codes} -
+                                     {None})
+    return tuple(totals)
+
+
+def layout_by_freq(text_dir: str, list_file: str, out_file: str,
+                   jobs: int = 1, readers: int = 4, depth: int = 16):
+    counter = count_texts(text_dir, jobs=jobs, readers=readers, depth=depth)
+
+    with open(list_file, 'r', encoding='UTF-8') as f:
+        char_list: List[int] = json.load(f)
+
+    code_order = sorted(char_list)
+    freq_order = sorted(code_order, key=lambda c: -counter[chr(c)])
 
-    for file in files:
-        with open(file, 'r', encoding='UTF-8') as f:
-            for char_code in json.load(f):
-                char_set.add(char_code)
+    with open(out_file, 'w') as f:
+        json.dump(freq_order, f)
 
-    if 0xa in char_set:
-        char_set.remove(0xa)
-    char_list = sorted(list(char_set))
+    capacity = FontBitmap.capacity()
+    page_maps = [
+        {c: i // capacity for i, c in enumerate(order)}
+        for order in (code_order, freq_order)
+    ]
 
-    with open(out_file, 'w') as f:
-        json.dump(char_list, f)
+    sources = find_sources(text_dir)
+    totals = [0, 0, 0]
+    for _, result in pipeline.imap(
+            sources, None, partial(count_line_pages, page_maps=page_maps),
+            jobs=jobs, readers=readers, depth=depth):
+        totals = [a + b for a, b in zip(totals, result)]
 
-    print(f"Total: {len(char_list)}")
+    lines = max(totals[0], 1)
+    print(f"Total: {len(freq_order)}")
+    print(f"Pages per line (codepoint order): {totals[1] / lines:.3f}")
+    print(f"Pages per line (frequency order): {totals[2] / lines:.3f}")
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    if args.command == 'count':
-        count_from_dir(args.d[0], args.o[0])
-    elif args.command == 'from_csv':
-        csv_to_txt(args.i[0], args.o[0])
-    elif args.command == 'merge':
-        merge_lists(args.files, args.o[0])
-    else:
-        parser.print_help()
+    with profiling.session(args):
+        if args.command == 'count':
+            count_from_dir(args.d[0], args.o[0],
+                           freq_file=args.freq[0] if args.freq else None,
+                           index_file=args.index[0] if args.index else None,
+                           jobs=args.jobs, readers=args.readers,
+                           depth=args.queue_depth)
+        elif args.command == 'from_csv':
+            csv_to_txt(args.i[0], args.o[0])
+        elif args.command == 'merge':
+            merge_lists(args.files, args.o[0])
+        elif args.command == 'export':
+            export_index(args.index[0], args.o[0],
+                         freq_file=args.freq[0] if args.freq else None)
+        elif args.command == 'layout':
+            layout_by_freq(args.d[0], args.l[0], args.o[0], jobs=args.jobs,
+                           readers=args.readers, depth=args.queue_depth)
+        else:
+            parser.print_help()
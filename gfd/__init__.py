@@ -1,5 +1,21 @@
-from .font_bitmap import FontBitmap
-from .gfd import GFD
-from .glyph_entry import GlyphEntry
+import importlib
 
-__all__ = [FontBitmap, GFD, GlyphEntry]
+_modules = {
+    'FontBitmap': 'font_bitmap',
+    'GFD': 'gfd',
+    'GlyphEntry': 'glyph_entry'
+}
+
+__all__ = list(_modules)
+
+
+def __getattr__(name: str):
+    # Pillow is only needed once one of these is used (PEP 562)
+    module = _modules.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{module}", __name__), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
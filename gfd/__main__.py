@@ -2,13 +2,13 @@ import argparse
 import csv
 import json
 import os
-from typing import List
+import sys
+from typing import Dict, List, Set
 
-from PIL import ImageFont
-
-from ..tex import MTTex
-from .font_bitmap import FontBitmap
+from .. import pipeline, profiling
+from ..gmd.texts import UNDECODABLE, find_sources, read_texts
 from .gfd import GFD
+from .generator import generate_gfds
 from .glyph_entry import GlyphEntry
 
 parser = argparse.ArgumentParser(
@@ -16,11 +16,17 @@ parser = argparse.ArgumentParser(
     description='Processing GFD files.'
 )
 
+profiling.add_arguments(parser)
+
 command_parsers = parser.add_subparsers(title='commands', dest='command',
                                         help='GFD process')
 dump_parser = command_parsers.add_parser('dump', help='Unpack GMD files')
 generate_parser = command_parsers.add_parser('generate', help='Repack to GMD')
 export_parser = command_parsers.add_parser('export', help='Export GMD')
+coverage_parser = command_parsers.add_parser(
+    'coverage', help='Check texts for characters missing in fonts')
+width_parser = command_parsers.add_parser(
+    'check-width', help='Check texts for lines wider than the text box')
 
 dump_parser.add_argument('gfd', metavar='gfd_file', type=str, nargs=1,
                          help='GFD file')
@@ -34,18 +40,53 @@ generate_parser.add_argument('-i', metavar='res_dir', type=str, nargs=1,
 generate_parser.add_argument('-f', metavar='font', type=str, nargs=1,
                              help='TrueType font file', required=True)
 
-generate_parser.add_argument('-n', metavar='font', type=str, nargs=1,
-                             help='GFD file index', required=True)
+generate_parser.add_argument('-n', metavar='font', type=str, nargs='+',
+                             help='GFD file indices, or "all"', required=True)
 
 generate_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
                              help='Output directory', required=True)
 
+generate_parser.add_argument('--layout', metavar='layout_file', type=str,
+                             nargs=1, help='JSON list of glyph placing order')
+
 export_parser.add_argument('-i', metavar='gfd_file', type=str, nargs=1,
                            help='GFD file', required=True)
 
 export_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
                            help='Output directory', required=True)
 
+export_parser.add_argument('-t', metavar='tex_dir', type=str, nargs=1,
+                           help='TEX files directory (default: GFD directory)')
+
+export_parser.add_argument('--sheet', action='store_true',
+                           help='Write one sprite sheet and metrics JSON')
+
+pipeline.add_arguments(generate_parser)
+pipeline.add_arguments(export_parser)
+
+coverage_parser.add_argument('text', metavar='text_dir', type=str, nargs=1,
+                             help='GMD files or unpacked texts directory')
+
+coverage_parser.add_argument('-f', metavar='gfd_file', type=str, nargs='+',
+                             help='GFD files to check', required=True)
+
+coverage_parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                             help='Output JSON report')
+
+width_parser.add_argument('text', metavar='text_dir', type=str, nargs=1,
+                          help='GMD files or unpacked texts directory')
+
+width_parser.add_argument('-f', metavar='gfd_file', type=str, nargs=1,
+                          help='GFD file of the text font', required=True)
+
+width_parser.add_argument('-w', metavar='pixels', type=int, nargs=1,
+                          help='Maximum line width', required=True)
+
+width_parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                          help='Output JSON lines report')
+
+pipeline.add_arguments(width_parser)
+
 
 def dump_gfd(gfd_file: str, dump_dir: str) -> None:
     if not gfd_file.endswith('.gfd'):
@@ -60,88 +101,93 @@ def dump_gfd(gfd_file: str, dump_dir: str) -> None:
         f.write(gfd.dump_header())
 
     map_file = f"{base_name}_map.csv"
-    font_tab = [vars(g) for g in gfd.glyphs]
+    font_tab = [g.to_dict() for g in gfd.glyphs]
     with open(os.path.join(dump_dir, map_file), 'w', encoding='utf8') as f:
-        writer = csv.DictWriter(f, fieldnames=font_tab[0].keys())
+        writer = csv.DictWriter(f, fieldnames=GlyphEntry.__slots__)
         writer.writeheader()
         writer.writerows(font_tab)
 
 
-def generate_gfd(font_name: str, out_dir: str, res_dir: str, font_index: str):
-    os.makedirs(out_dir, exist_ok=True)
-
-    base_name = None
-    for gfd_header in os.listdir(res_dir):
-        if gfd_header == f"font{font_index}_jpn_header.bin":
-            base_name = gfd_header[:-11]  # len('_header.bin')
-            break
-
-    if base_name is None:
-        raise ValueError(f"No GFD file with index {font_index}")
-
-    char_list_name = f"{base_name}_list.json"
-    with open(os.path.join(res_dir, char_list_name), 'r') as f:
-        char_list = json.load(f)
+def export_gfd(gfd_file: str, out_dir: str, tex_dir: str = None,
+               sheet: bool = False, jobs: int = 1, readers: int = 4,
+               depth: int = 16) -> None:
+    assert gfd_file.endswith('.gfd')
 
-    with open(os.path.join(res_dir, gfd_header), 'rb') as f:
+    with open(gfd_file, 'rb') as f:
         gfd = GFD.load(f)
 
-    ttf = ImageFont.truetype(font_name, gfd.header.size_px)
-
-    bitmaps: List[FontBitmap] = list()
-    if font_index == '00':
-        adjust = (0, 2)
-    else:
-        adjust = (0, 0)
-    bitmap = FontBitmap(adjust)
-
-    gfd_entries: List[GlyphEntry] = list()
-    for char_code in char_list:
-        txt = chr(char_code)
-
-        entry = bitmap.push(txt, len(bitmaps), ttf)
-
-        gfd_entries.append(entry)
+    if tex_dir is None:
+        tex_dir = os.path.dirname(gfd_file)
+    base_name = os.path.splitext(os.path.basename(gfd_file))[0]
+    gfd.dump(out_dir, tex_dir, base_name, sheet=sheet, jobs=jobs,
+             readers=readers, depth=depth)
 
-        # Next bitmap
-        if bitmap.full:
-            bitmaps.append(bitmap)
-            bitmap = FontBitmap(adjust)
-    bitmaps.append(bitmap)
 
-    gfd.header.bitmap_count = len(bitmaps)
-    gfd.header.entry_count = len(gfd_entries)
-    gfd.glyphs = gfd_entries
+def check_coverage(text_dir: str, gfd_files: List[str],
+                   out_file: str = None) -> None:
+    fonts: Dict[str, GFD] = dict()
+    for gfd_file in gfd_files:
+        with open(gfd_file, 'rb') as f:
+            fonts[os.path.basename(gfd_file)] = GFD.load(f)
 
-    gfd_name = f"{base_name}.gfd"
-    gfd.repack(os.path.join(out_dir, gfd_name))
+    report: Dict[str, Dict[str, str]] = {name: dict() for name in fonts}
+    for source in find_sources(text_dir):
+        chars: Set[str] = set()
+        for text in read_texts(source):
+            chars.update(text)
+        chars.difference_update('\r\n', UNDECODABLE)
 
-    for i in range(len(bitmaps)):
-        tex = MTTex.new((512, 512), bitmaps[i].getdata())
-        tex_name = f"{base_name}_{i:02d}_AM_NOMIP.tex"
-        tex.export_tex(os.path.join(out_dir, tex_name))
+        source_name = os.path.relpath(source, text_dir)
+        for name, gfd in fonts.items():
+            missing = gfd.missing(''.join(chars))
+            if missing:
+                report[name][source_name] = ''.join(sorted(missing))
 
+    for name, files in report.items():
+        missing = set(''.join(files.values()))
+        print(f"{name}: {len(missing)} missing in {len(files)} files")
+        for source_name, chars in files.items():
+            print(f"  {source_name}: {chars}")
 
-def export_gfd(gfd_file: str, out_dir: str) -> None:
-    assert gfd_file.endswith('.gfd')
-
-    with open(gfd_file, 'rb') as f:
-        gfd = GFD.load(f)
-        gfd.dump(out_dir)
+    if out_file is not None:
+        with open(out_file, 'w', encoding='UTF-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    if args.command == 'dump':
-        dump_gfd(args.gfd[0], args.o[0])
-    elif args.command == 'generate':
-        generate_gfd(
-            font_name=args.f[0],
-            out_dir=args.o[0],
-            res_dir=args.i[0],
-            font_index=args.n[0]
-        )
-    elif args.command == 'export':
-        export_gfd(args.i[0], args.o[0])
-    else:
-        parser.print_help()
+    with profiling.session(args):
+        if args.command == 'dump':
+            dump_gfd(args.gfd[0], args.o[0])
+        elif args.command == 'generate':
+            generate_gfds(
+                font_name=args.f[0],
+                out_dir=args.o[0],
+                res_dir=args.i[0],
+                font_indices=args.n,
+                jobs=args.jobs,
+                layout_file=args.layout[0] if args.layout else None,
+                readers=args.readers,
+                depth=args.queue_depth
+            )
+        elif args.command == 'export':
+            export_gfd(args.i[0], args.o[0],
+                       tex_dir=args.t[0] if args.t else None,
+                       sheet=args.sheet,
+                       jobs=args.jobs,
+                       readers=args.readers,
+                       depth=args.queue_depth)
+        elif args.command == 'coverage':
+            check_coverage(args.text[0], args.f, args.o[0] if args.o else None)
+        elif args.command == 'check-width':
+            # NumPy is only needed by this command
+            from .width import check_widths
+            overflows = check_widths(args.text[0], args.f[0], args.w[0],
+                                     out_file=args.o[0] if args.o else None,
+                                     jobs=args.jobs,
+                                     readers=args.readers,
+                                     depth=args.queue_depth)
+            if overflows > 0:
+                sys.exit(1)
+        else:
+            parser.print_help()
@@ -1,13 +1,19 @@
-from typing import List, Tuple
-from PIL import Image, ImageDraw, ImageFont
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Tuple
 
 from .glyph_entry import GlyphEntry
 
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
 
 class FontBitmap(object):
     global_offset = 20
 
     def __init__(self, adjust: Tuple[int, int] = (0, 0)) -> None:
+        from PIL import Image, ImageDraw
+
         self.__image = Image.new('RGBA', (512, 512), (255, 255, 255, 0))
         self.draw = ImageDraw.Draw(self.__image)
 
@@ -48,6 +54,11 @@ class FontBitmap(object):
 
         return entry
 
+    @staticmethod
+    def capacity() -> int:
+        # Glyphs per bitmap, as laid out by __forward_pos
+        return (510 // FontBitmap.global_offset) ** 2
+
     def __forward_pos(self) -> None:
         # Next column
         self.offset_x += FontBitmap.global_offset
@@ -66,3 +77,7 @@ class FontBitmap(object):
 
     def getdata(self) -> List[Tuple[int, ...]]:
         return list(self.__image.getdata())
+
+    def alpha(self) -> bytes:
+        # The only channel stored in the TEX page
+        return self.__image.getchannel('A').tobytes()
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from .. import pipeline
+from ..profiling import count, traced
+from ..tex import MTTex
+from .font_bitmap import FontBitmap
+from .gfd import GFD
+from .glyph_entry import GlyphEntry
+
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+# Optional per-font settings in the resources directory, e.g.
+# {"00": {"adjust": [0, 2], "layout": "layout.json"},
+#  "01": {"list": "font_jpn_list.json"}}
+FONT_CONFIG = 'fonts.json'
+# Adjust of fonts without one in FONT_CONFIG, as the game fonts need
+DEFAULT_ADJUST = {'00': (0, 2)}
+# Source hashes of the generated files in the output directory
+MANIFEST = '.gfd_manifest.json'
+
+# (file name, source hash, content or None if unchanged)
+OutputFile = Tuple[str, str, Optional[bytes]]
+
+
+class FontJob(object):
+    def __init__(self,
+                 base_name: str,
+                 gfd: GFD,
+                 char_list: List[int],
+                 adjust: Tuple[int, int],
+                 layout: Optional[List[int]] = None) -> None:
+        self.base_name = base_name
+        self.gfd = gfd
+        self.char_list = char_list
+        self.adjust = adjust
+        self.layout = layout
+
+    def render_order(self) -> List[int]:
+        # Characters in layout first, then the rest in list order
+        if self.layout is None:
+            return self.char_list
+
+        chars = set(self.char_list)
+        order = [c for c in dict.fromkeys(self.layout) if c in chars]
+        placed = set(order)
+        order.extend(c for c in self.char_list if c not in placed)
+        return order
+
+
+def find_fonts(res_dir: str) -> Dict[str, str]:
+    fonts: Dict[str, str] = dict()
+    regex = re.compile(r"font(.+)_jpn_header\.bin")
+    for file in sorted(os.listdir(res_dir)):
+        result = re.fullmatch(regex, file)
+        if result is not None:
+            fonts[result.group(1)] = file[:-11]  # len('_header.bin')
+    return fonts
+
+
+def load_font_config(res_dir: str) -> Dict[str, dict]:
+    config_file = os.path.join(res_dir, FONT_CONFIG)
+    if not os.path.isfile(config_file):
+        return dict()
+    with open(config_file, 'r') as f:
+        return json.load(f)
+
+
+def load_jobs(res_dir: str, font_indices: List[str],
+              layout_file: str = None) -> List[FontJob]:
+    fonts = find_fonts(res_dir)
+    if 'all' in font_indices:
+        font_indices = list(fonts.keys())
+
+    config = load_font_config(res_dir)
+    char_lists: Dict[str, List[int]] = dict()
+
+    jobs: List[FontJob] = list()
+    for font_index in font_indices:
+        base_name = fonts.get(font_index)
+        if base_name is None:
+            raise ValueError(f"No GFD file with index {font_index}")
+
+        font_config = config.get(font_index, dict())
+        char_list_name = font_config.get('list', f"{base_name}_list.json")
+        if char_list_name not in char_lists:
+            with open(os.path.join(res_dir, char_list_name), 'r') as f:
+                char_lists[char_list_name] = json.load(f)
+
+        layout_name = font_config.get('layout')
+        if layout_name is not None:
+            layout_name = os.path.join(res_dir, layout_name)
+        else:
+            layout_name = layout_file
+        if layout_name is not None and layout_name not in char_lists:
+            with open(layout_name, 'r') as f:
+                char_lists[layout_name] = json.load(f)
+
+        with open(os.path.join(res_dir, f"{base_name}_header.bin"), 'rb') as f:
+            gfd = GFD.load(f)
+
+        adjust = font_config.get('adjust',
+                                 DEFAULT_ADJUST.get(font_index, (0, 0)))
+        jobs.append(FontJob(base_name,
+                            gfd,
+                            char_lists[char_list_name],
+                            tuple(adjust),
+                            char_lists.get(layout_name)))
+    return jobs
+
+
+class OutputCache(object):
+    # A file is not encoded or written again if its source hash is the one
+    # recorded and the file was not modified since it was written
+    def __init__(self, out_dir: str) -> None:
+        self.out_dir = out_dir
+        self.entries: Dict[str, List] = dict()
+        manifest = os.path.join(out_dir, MANIFEST)
+        if os.path.isfile(manifest):
+            with open(manifest, 'r') as f:
+                self.entries = json.load(f)
+
+    def known(self) -> Dict[str, str]:
+        known: Dict[str, str] = dict()
+        for name, (source_hash, mtime, size) in self.entries.items():
+            try:
+                stat = os.stat(os.path.join(self.out_dir, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size) == (mtime, size):
+                known[name] = source_hash
+        return known
+
+    def record(self, name: str, source_hash: str) -> None:
+        stat = os.stat(os.path.join(self.out_dir, name))
+        self.entries[name] = [source_hash, stat.st_mtime_ns, stat.st_size]
+
+    def save(self) -> None:
+        manifest = os.path.join(self.out_dir, MANIFEST)
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(manifest + '.tmp', manifest)
+
+
+@lru_cache(maxsize=None)
+def load_ttf(font_name: str, size: int) -> ImageFont.FreeTypeFont:
+    from PIL import ImageFont
+
+    return ImageFont.truetype(font_name, size)
+
+
+@traced('gfd.render')
+def build_font(job: FontJob,
+               ttf: ImageFont.FreeTypeFont) -> List[FontBitmap]:
+    bitmaps: List[FontBitmap] = list()
+    bitmap = FontBitmap(job.adjust)
+
+    gfd_entries: List[GlyphEntry] = list()
+    for char_code in job.render_order():
+        txt = chr(char_code)
+
+        entry = bitmap.push(txt, len(bitmaps), ttf)
+
+        gfd_entries.append(entry)
+
+        # Next bitmap
+        if bitmap.full:
+            bitmaps.append(bitmap)
+            bitmap = FontBitmap(job.adjust)
+    bitmaps.append(bitmap)
+
+    # Glyph table keeps the char list order whatever the layout is
+    if job.layout is not None:
+        entries = {ord(e.char): e for e in gfd_entries}
+        gfd_entries = [entries[c] for c in job.char_list]
+
+    count('gfd.glyphs_rendered', len(gfd_entries))
+    job.gfd.header.bitmap_count = len(bitmaps)
+    job.gfd.header.entry_count = len(gfd_entries)
+    job.gfd.glyphs = gfd_entries
+
+    return bitmaps
+
+
+@traced('gfd.encode')
+def encode_font(job: FontJob, bitmaps: List[FontBitmap],
+                known: Optional[Dict[str, str]] = None) -> List[OutputFile]:
+    # Files whose source hash is in known are not encoded
+    known = known if known is not None else dict()
+
+    gfd_blob = job.gfd.to_bytes()
+    gfd_name = f"{job.base_name}.gfd"
+    gfd_hash = hashlib.sha1(gfd_blob).hexdigest()
+    files: List[OutputFile] = [
+        (gfd_name, gfd_hash, None if known.get(gfd_name) == gfd_hash
+         else gfd_blob)
+    ]
+
+    for i in range(len(bitmaps)):
+        tex_name = f"{job.base_name}_{i:02d}_AM_NOMIP.tex"
+        tex_hash = hashlib.sha1(bitmaps[i].alpha()).hexdigest()
+        if known.get(tex_name) == tex_hash:
+            files.append((tex_name, tex_hash, None))
+            continue
+        tex = MTTex.new((512, 512), bitmaps[i].getdata())
+        files.append((tex_name, tex_hash, tex.to_bytes()))
+
+    count('gfd.files_skipped', sum(blob is None for _, _, blob in files))
+    return files
+
+
+@traced('gfd.write')
+def write_files(out_dir: str, files: List[OutputFile],
+                outputs: Optional[OutputCache] = None) -> List[str]:
+    # Returns the names of the files written
+    written: List[str] = list()
+    for name, source_hash, blob in files:
+        if blob is None:
+            continue
+        with open(os.path.join(out_dir, name), 'wb') as f:
+            f.write(blob)
+        if outputs is not None:
+            outputs.record(name, source_hash)
+        written.append(name)
+    return written
+
+
+def write_font(job: FontJob, bitmaps: List[FontBitmap], out_dir: str) -> None:
+    write_files(out_dir, encode_font(job, bitmaps))
+
+
+def generate_font(font_name: str, known: Dict[str, str],
+                  job: FontJob) -> List[OutputFile]:
+    # Faces are cached per size, in each worker process
+    ttf = load_ttf(font_name, job.gfd.header.size_px)
+    return encode_font(job, build_font(job, ttf), known)
+
+
+def report_font(job: FontJob, files: List[OutputFile],
+                written: List[str]) -> None:
+    print(f"{job.base_name}: {len(written)} of {len(files)} files changed")
+    for name in written:
+        print(f"  {name}")
+
+
+def generate_gfds(font_name: str, out_dir: str, res_dir: str,
+                  font_indices: List[str], jobs: int = 1,
+                  layout_file: str = None, readers: int = 4,
+                  depth: int = 16) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+
+    font_jobs = load_jobs(res_dir, font_indices, layout_file)
+    # Same sizes next to each other, so workers reuse loaded faces
+    font_jobs.sort(key=lambda j: j.gfd.header.size_px)
+
+    outputs = OutputCache(out_dir)
+
+    def write(job: FontJob, files: List[OutputFile]) -> None:
+        report_font(job, files, write_files(out_dir, files, outputs))
+
+    try:
+        pipeline.run(font_jobs, None,
+                     partial(generate_font, font_name, outputs.known()),
+                     write, jobs=jobs, readers=readers, depth=depth)
+    finally:
+        outputs.save()
+
+
+def generate_gfd(font_name: str, out_dir: str, res_dir: str, font_index: str):
+    generate_gfds(font_name, out_dir, res_dir, [font_index])
@@ -1,17 +1,55 @@
 from __future__ import annotations
 
+import json
 import os
 import struct
-from io import BufferedReader
-from typing import List
+from io import BufferedReader, BytesIO
+from typing import (TYPE_CHECKING, Dict, Iterable, KeysView, List, Optional,
+                    Set, Tuple, Union)
 
-from PIL import Image
+from .. import pipeline
+from ..profiling import count, traced
+from .glyph_entry import GlyphEntry, Shared
 
-from .glyph_entry import GlyphEntry
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def _export_page(data: Tuple[bytes, List[Tuple[int, int, int, int]], bool]) \
+        -> List[Union[Image.Image, Optional[bytes]]]:
+    # Glyph crops for a sheet, or glyph PNG files (None if empty)
+    from PIL import Image
+
+    from ..tex import MTTex
+
+    content, boxes, sheet = data
+    tex = MTTex.load(BytesIO(content))
+
+    page = Image.new('RGBA', (tex.header.width, tex.header.height))
+    page.putdata(tex.bmp_data)
+
+    glyphs = [page.crop(box) for box in boxes]
+    if sheet:
+        return glyphs
+
+    pngs: List[Optional[bytes]] = list()
+    for glyph in glyphs:
+        if glyph.width == 0 or glyph.height == 0:
+            pngs.append(None)
+            continue
+        bg = Image.new('RGBA', glyph.size, (0, 0, 0, 255))
+        bg.paste(glyph, (0, 0), glyph)
+        out = BytesIO()
+        bg.save(out, 'PNG')
+        pngs.append(out.getvalue())
+    return pngs
 
 
 class GFD(object):
     class _Header(object):
+        __slots__ = ('magic', 'version', 'unknown1', 'size_px',
+                     'bitmap_count', 'entry_count', 'unknown2', 'name_length')
+
         def __init__(self,
                      magic: bytes,       # b'GMD\x0'
                      version: bytes,     # 4 bytes
@@ -55,47 +93,167 @@ class GFD(object):
     def __init__(self) -> None:
         self.name = None
         self.header = None
-        self.glyphs: List[GlyphEntry] = list()
+        self.__glyphs: List[GlyphEntry] = list()
+        self.__index: Dict[int, int] = dict()
+
+    @property
+    def glyphs(self) -> List[GlyphEntry]:
+        return self.__glyphs
+
+    @glyphs.setter
+    def glyphs(self, glyphs: Iterable[GlyphEntry]) -> None:
+        self.__glyphs = list(glyphs)
+        self.reindex()
+
+    def reindex(self) -> None:
+        # Call after mutating `glyphs` in place
+        self.__index = {ord(g.char): i for i, g in enumerate(self.__glyphs)}
 
     @staticmethod
-    def load(f: BufferedReader) -> GFD:
+    def __code(char: Union[str, int]) -> int:
+        return char if isinstance(char, int) else ord(char)
+
+    def __contains__(self, char: Union[str, int]) -> bool:
+        return GFD.__code(char) in self.__index
+
+    def find(self, char: Union[str, int]) -> Optional[GlyphEntry]:
+        idx = self.__index.get(GFD.__code(char))
+        if idx is None:
+            return None
+        return self.__glyphs[idx]
+
+    def codepoints(self) -> KeysView[int]:
+        return self.__index.keys()
+
+    def missing(self, text: str) -> Set[str]:
+        return {c for c in set(text) if ord(c) not in self.__index}
+
+    @staticmethod
+    def load_header(f: BufferedReader) -> GFD:
+        # Header and name only, without glyphs
         gfd = GFD()
         gfd.header = GFD._Header.from_bytes(f.read(0x40))
+        assert gfd.header.magic == b'GFD\x00'
         gfd.name = f.read(gfd.header.name_length + 1)[:-1].decode('UTF-8')
-        while True:
-            buf = f.read(20)
-            if not buf:
-                break
-            glyph = GlyphEntry.load(buf)
-            gfd.glyphs.append(glyph)
         return gfd
 
-    def dump(self, dump_dir: str) -> None:
-        raise NotImplementedError()
+    @staticmethod
+    @traced('gfd.load')
+    def load(f: BufferedReader) -> GFD:
+        gfd = GFD.load_header(f)
+        data = f.read()
+        # Values are shared within this file only
+        shared: Shared = dict()
+        gfd.glyphs = [
+            GlyphEntry.load(data[i:i+20], shared)
+            for i in range(0, len(data) - 19, 20)
+        ]
+        count('gfd.glyphs_loaded', len(gfd.glyphs))
+        return gfd
+
+    @staticmethod
+    def from_bytes(content: bytes) -> GFD:
+        return GFD.load(BytesIO(content))
+
+    @staticmethod
+    async def aload(path: str) -> GFD:
+        from .. import aio
+
+        return await aio.run(GFD.from_bytes, await aio.read(path))
+
+    @traced('gfd.dump')
+    def dump(self, dump_dir: str, tex_dir: str, base_name: str,
+             sheet: bool = False, jobs: int = 1, readers: int = 4,
+             depth: int = 16) -> None:
         os.makedirs(dump_dir, exist_ok=True)
 
-        cnt = 0
-        for glyph in self.glyphs:
-            tex_file = f"font00_jpn_0{glyph.tex}_AM_NOMIP.tex.00.png"
-            tex = Image.open(tex_file)
+        pages: Dict[int, List[int]] = dict()
+        for i, glyph in enumerate(self.glyphs):
+            pages.setdefault(glyph.tex, list()).append(i)
+
+        def read(tex: int) \
+                -> Tuple[bytes, List[Tuple[int, int, int, int]], bool]:
+            tex_file = os.path.join(
+                tex_dir, f"{base_name}_{tex:02d}_AM_NOMIP.tex")
+            glyphs = [self.glyphs[i] for i in pages[tex]]
+            boxes = [
+                (g.pos[0], g.pos[1],
+                 g.pos[0] + g.size[0], g.pos[1] + g.size[1])
+                for g in glyphs
+            ]
+            return pipeline.read_file(tex_file), boxes, sheet
 
-            box = (glyph.posx,
-                   glyph.posy,
-                   glyph.posx + glyph.width,
-                   glyph.posy + glyph.height)
-            font = tex.crop(box)
+        crops: List[Optional[Image.Image]] = [None] * len(self.glyphs)
 
-            bg = Image.new('RGBA', (glyph.width, glyph.height), (0, 0, 0, 255))
-            bg.paste(font, (0, 0), font)
+        def write(tex: int, results: List) -> None:
+            for i, result in zip(pages[tex], results):
+                if sheet:
+                    crops[i] = result
+                elif result is not None:
+                    with open(os.path.join(dump_dir, f"{i}.png"), 'wb') as f:
+                        f.write(result)
 
-            bg.save(os.path.join(dump_dir, f"{cnt}.png"))
-            cnt += 1
+        pipeline.run(list(pages.keys()), read, _export_page, write,
+                     jobs=jobs, readers=readers, depth=depth)
+
+        if not sheet:
+            return
+
+        self.__dump_sheet(dump_dir, base_name, crops)
+
+    def __dump_sheet(self, dump_dir: str, base_name: str,
+                     crops: List[Image.Image],
+                     sheet_width: int = 1024) -> None:
+        from PIL import Image
+
+        # Shelf packing in glyph table order
+        places: List[Tuple[int, int]] = list()
+        x, y, row_height = 0, 0, 0
+        for crop in crops:
+            if x + crop.width > sheet_width:
+                x, y = 0, y + row_height
+                row_height = 0
+            places.append((x, y))
+            x += crop.width
+            row_height = max(row_height, crop.height)
+
+        sheet = Image.new('RGBA', (sheet_width, max(y + row_height, 1)))
+        for crop, place in zip(crops, places):
+            sheet.paste(crop, place)
+        sheet.save(os.path.join(dump_dir, f"{base_name}_sheet.png"))
+
+        metrics = [
+            {
+                'char': g.char,
+                'code': ord(g.char),
+                'tex': g.tex,
+                'pos': g.pos,
+                'size': g.size,
+                'pos_off': g.pos_off,
+                'pos_add': g.pos_add,
+                'offset': g.offset,
+                'sheet': place
+            }
+            for g, place in zip(self.glyphs, places)
+        ]
+        with open(os.path.join(dump_dir, f"{base_name}_metrics.json"), 'w',
+                  encoding='UTF-8') as f:
+            json.dump(metrics, f, ensure_ascii=False)
+
+    def to_bytes(self) -> bytes:
+        return b''.join(
+            [self.header.dump(self.name)] + [g.dump() for g in self.glyphs]
+        )
 
     def repack(self, pack_file: str) -> None:
+        blob = self.to_bytes()
         with open(pack_file, 'wb') as f:
-            f.write(self.header.dump(self.name))
-            for g in self.glyphs:
-                f.write(g.dump())
+            f.write(blob)
+
+    async def asave(self, path: str) -> None:
+        from .. import aio
+
+        await aio.write(path, await aio.run(self.to_bytes))
 
     def dump_header(self) -> bytes:
         return self.header.dump(self.name)
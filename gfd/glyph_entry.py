@@ -1,10 +1,20 @@
 from __future__ import annotations
 
 import struct
-from typing import Tuple
+from typing import Dict, Optional, Tuple
+
+# Glyphs of a font share a few sizes, offsets and (across pages) positions,
+# entries loaded with the same dict reuse one tuple per distinct value
+Shared = Dict[Tuple[int, int], Tuple[int, int]]
+
+
+def _share(shared: Shared, value: Tuple[int, int]) -> Tuple[int, int]:
+    return shared.setdefault(value, value)
 
 
 class GlyphEntry(object):
+    __slots__ = ('char', 'tex', 'pos', 'size', 'pos_off', 'pos_add', 'offset')
+
     def __init__(self,
                  char: str,
                  tex: int,
@@ -35,15 +45,16 @@ class GlyphEntry(object):
         return bytes([x0, x1, x2])
 
     @staticmethod
-    def load(blob: bytes) -> GlyphEntry:
+    def load(blob: bytes, shared: Optional[Shared] = None) -> GlyphEntry:
+        shared = shared if shared is not None else dict()
         parts = struct.unpack_from('<H18B', blob)
         char = chr(parts[0])
         tex = parts[3]
-        pos = GlyphEntry.__split_1_5_bytes(parts[4:7])
-        size = GlyphEntry.__split_1_5_bytes(parts[7:10])
-        pos_off = GlyphEntry.__split_1_5_bytes(parts[11:14])
+        pos = _share(shared, GlyphEntry.__split_1_5_bytes(parts[4:7]))
+        size = _share(shared, GlyphEntry.__split_1_5_bytes(parts[7:10]))
+        pos_off = _share(shared, GlyphEntry.__split_1_5_bytes(parts[11:14]))
         offset = parts[14]
-        pos_add = parts[15], parts[16]
+        pos_add = _share(shared, (parts[15], parts[16]))
         return GlyphEntry(char, tex, pos, size, pos_off, pos_add, offset)
 
     def __str__(self) -> str:
@@ -54,12 +65,14 @@ class GlyphEntry(object):
             f" -{self.pos_off}"
             f" +{self.pos_add}"
             f" {self.offset}"
-            f" \t{self.raw}"
         )
 
     def __repr__(self) -> str:
         return self.__str__()
 
+    def to_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in GlyphEntry.__slots__}
+
     def dump(self) -> bytes:
         blob = bytes()
         blob += struct.pack('<H', ord(self.char))
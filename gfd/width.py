@@ -0,0 +1,90 @@
+import json
+import os
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .. import pipeline
+from ..gmd.texts import find_sources, printable, read_sections, strip_tags
+from .gfd import GFD
+
+
+def width_table(gfd: GFD) -> np.ndarray:
+    # Advance width by codepoint, characters without a glyph (and beyond
+    # the table, mapped to the last entry) count as a full cell
+    size = max(max(gfd.codepoints(), default=0), ord('\n')) + 2
+    table = np.full(size, gfd.header.size_px, dtype=np.int32)
+    for g in gfd.glyphs:
+        table[ord(g.char)] = g.pos_off[0] + g.pos_add[0]
+    table[ord('\n')] = 0
+    return table
+
+
+def line_widths(table: np.ndarray, texts: List[str]) -> np.ndarray:
+    # Pixel width of every line of every text, in order
+    joined = '\n'.join(texts).encode('UTF-32-LE', 'surrogatepass')
+    codes = np.frombuffer(joined, dtype='<u4')
+    codes = np.minimum(codes, len(table) - 1)
+
+    sums = np.concatenate(([0], np.cumsum(table[codes])))
+    breaks = np.flatnonzero(codes == ord('\n'))
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(codes)]))
+    return sums[ends] - sums[starts]
+
+
+def check_sections(table: np.ndarray, max_width: int,
+                   sections: List[Tuple[str, str]]) -> List[Dict[str, object]]:
+    texts = [strip_tags(text) for _, text in sections]
+    widths = line_widths(table, texts)
+    over = np.flatnonzero(widths > max_width)
+    if len(over) == 0:
+        return list()
+
+    counts = np.array([text.count('\n') + 1 for text in texts])
+    owners = np.repeat(np.arange(len(texts)), counts)
+    firsts = np.cumsum(counts) - counts
+    lines = '\n'.join(texts).split('\n')
+    return [{
+        'section': sections[owners[i]][0],
+        'line': int(i - firsts[owners[i]]) + 1,
+        'width': int(widths[i]),
+        'text': lines[i]
+    } for i in over]
+
+
+def check_widths(text_dir: str, gfd_file: str, max_width: int,
+                 out_file: Optional[str] = None, jobs: int = 1,
+                 readers: int = 4, depth: int = 16) -> int:
+    # Returns the number of lines over max_width
+    with open(gfd_file, 'rb') as f:
+        table = width_table(GFD.load(f))
+
+    sources = find_sources(text_dir)
+    report: List[Dict[str, object]] = list()
+    for source, overflows in pipeline.imap(
+            sources, read_sections,
+            partial(check_sections, table, max_width),
+            jobs=jobs, readers=readers, depth=depth):
+        if len(overflows) == 0:
+            continue
+        source_name = os.path.relpath(source, text_dir)
+        print(f"{source_name}:")
+        for overflow in overflows:
+            print(f"  {overflow['section']}:{overflow['line']}"
+                  f" {overflow['width']} px: {printable(overflow['text'])}")
+            overflow['path'] = source_name
+            report.append(overflow)
+
+    if out_file is not None:
+        # Bytes that are not UTF-8 are written back as they were read
+        with open(out_file, 'w', encoding='UTF-8',
+                  errors='surrogateescape') as f:
+            for overflow in report:
+                f.write(json.dumps(overflow, ensure_ascii=False))
+                f.write('\n')
+
+    files = len({overflow['path'] for overflow in report})
+    print(f"Lines over {max_width} px: {len(report)} in {files} files")
+    return len(report)
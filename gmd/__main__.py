@@ -1,91 +1,296 @@
 import argparse
 import json
 import os
-import re
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
-from .gmd import GMD, GMDSection
+from .. import pipeline, profiling
+from ..arc import Arc, ArcEntry
+from .diff import diff_dirs
+from .gmd import GMD
+from .store import TextStore
+from .texts import (JSONL, dump_path, find_dumps, load_dump, printable,
+                    write_gmd)
 
 parser = argparse.ArgumentParser(
     prog='python3 -m gmd',
     description='Pack and unpack GMD files.'
 )
 
+profiling.add_arguments(parser)
+
 command_parsers = parser.add_subparsers(title='commands', dest='command',
                                         help='GMD process')
 unpack_parser = command_parsers.add_parser('unpack', help='Unpack GMD files')
 repack_parser = command_parsers.add_parser('repack', help='Repack to GMD')
+patch_parser = command_parsers.add_parser('patch',
+                                          help='Replace sections in GMDs')
+export_parser = command_parsers.add_parser('export',
+                                           help='Export GMDs to a database')
+search_parser = command_parsers.add_parser('search',
+                                           help='Search texts in a database')
+import_parser = command_parsers.add_parser('import',
+                                           help='Repack GMDs from a database')
+diff_parser = command_parsers.add_parser('diff',
+                                         help='Compare sections of two GMD '
+                                              'directories')
 
 unpack_parser.add_argument('gmd', metavar='gmd_dir', type=str, nargs=1,
-                           help='GMD files directory')
+                           help='GMD (or ARC) files directory')
 
 unpack_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
                            help='Output directory', required=True)
 
+unpack_parser.add_argument('--format', type=str, default='dir',
+                           choices=['dir', 'jsonl'],
+                           help='A directory of section texts per GMD, '
+                                'or one JSON lines file per GMD')
+
 repack_parser.add_argument('res', metavar='res_dir', type=str, nargs=1,
                            help='Directories to repack')
 
 repack_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
                            help='Output directory', required=True)
 
+repack_parser.add_argument('--arc', metavar='arc_file', type=str, nargs=1,
+                           help='Write GMDs into a copy of this ARC file')
+
+patch_parser.add_argument('gmd', metavar='gmd_dir', type=str, nargs=1,
+                          help='Original GMD files directory')
+
+patch_parser.add_argument('-p', metavar='patch_file', type=str, nargs=1,
+                          help='JSON of {gmd file: {label or id: text}}',
+                          required=True)
+
+patch_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
+                          help='Output directory', required=True)
+
+export_parser.add_argument('gmd', metavar='gmd_dir', type=str, nargs=1,
+                           help='GMD files directory')
+
+export_parser.add_argument('-d', metavar='db_file', type=str, nargs=1,
+                           help='SQLite text database, updated if it exists',
+                           required=True)
+
+search_parser.add_argument('db', metavar='db_file', type=str, nargs=1,
+                           help='SQLite text database')
+
+search_parser.add_argument('query', metavar='query', type=str, nargs=1,
+                           help='Full-text query')
+
+search_parser.add_argument('--limit', metavar='n', type=int, default=100,
+                           help='Maximum number of results')
+
+import_parser.add_argument('db', metavar='db_file', type=str, nargs=1,
+                           help='SQLite text database')
+
+import_parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
+                           help='Output directory', required=True)
+
+import_parser.add_argument('--changed', action='store_true',
+                           help='Only repack GMDs edited in the database')
+
+diff_parser.add_argument('old', metavar='old_dir', type=str, nargs=1,
+                         help='Original GMD files directory')
+
+diff_parser.add_argument('new', metavar='new_dir', type=str, nargs=1,
+                         help='New GMD files directory')
+
+diff_parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                         help='Output JSON report (default: print it)')
+
+for batch_parser in (unpack_parser, repack_parser, patch_parser,
+                     export_parser, diff_parser):
+    pipeline.add_arguments(batch_parser)
+
+SKIPPED = "_sce08_c000_0000_jpn.gmd"
+
+
+def export_gmd(gmd: GMD, dump_name: str, dump_format: str = 'dir') -> None:
+    if dump_format == 'jsonl':
+        gmd.export_jsonl(dump_name + JSONL)
+    else:
+        gmd.export(dump_name)
+
 
-def unpack_gmds(gmd_dir: str, unpack_dir: str) -> None:
+def unpack_arc(arc_file: str, unpack_dir: str, dump_format: str = 'dir',
+               jobs: int = 1, depth: int = 16) -> None:
+    def write(entry: ArcEntry, gmd: GMD) -> None:
+        # Under the entry's path, entries of different folders can share
+        # a base name
+        print(f"Unpacking {entry.path}...")
+        dump_name = os.path.join(unpack_dir, *entry.path.split('\\'))
+        os.makedirs(os.path.dirname(dump_name), exist_ok=True)
+        export_gmd(gmd, dump_name, dump_format)
+
+    with open(arc_file, 'rb') as f:
+        arc = Arc.load(f)
+        entries = [
+            e for e in arc.entries
+            if e.ext == 'gmd' and e.base_name != SKIPPED
+        ]
+        # One reader, entries share the archive file
+        pipeline.run(entries, arc.read, GMD.from_bytes, write,
+                     jobs=jobs, readers=1, depth=depth)
+
+
+def unpack_gmds(gmd_dir: str, unpack_dir: str, dump_format: str = 'dir',
+                jobs: int = 1, readers: int = 4, depth: int = 16) -> None:
+    os.makedirs(unpack_dir, exist_ok=True)
+
+    files: List[str] = list()
     for file in os.listdir(gmd_dir):
+        if file.endswith('.arc'):
+            unpack_arc(os.path.join(gmd_dir, file), unpack_dir, dump_format,
+                       jobs=jobs, depth=depth)
+            continue
         if not file.endswith('.gmd'):
             continue
-        if file == "_sce08_c000_0000_jpn.gmd":
+        if file == SKIPPED:
             continue
+        files.append(file)
+
+    def write(file: str, gmd: GMD) -> None:
+        print(f"Unpacking {file}...")
+        export_gmd(gmd, os.path.join(unpack_dir, file), dump_format)
 
-        pack_name = os.path.join(gmd_dir, file)
-        with open(pack_name, 'rb') as f:
-            print(f"Unpacking {file}...")
-            gmd = GMD.load(f)
-            gmd.export(os.path.join(unpack_dir, file))
+    pipeline.run(files,
+                 lambda file: pipeline.read_file(os.path.join(gmd_dir, file)),
+                 GMD.from_bytes, write,
+                 jobs=jobs, readers=readers, depth=depth)
 
 
-def repack_gmds(unpack_dir: str, pack_dir: str):
+def repack_gmds(unpack_dir: str, pack_dir: str, arc_file: str = None,
+                jobs: int = 1, readers: int = 4, depth: int = 16):
     os.makedirs(pack_dir, exist_ok=True)
 
-    for file in os.listdir(unpack_dir):
-        gmd_file = os.path.join(unpack_dir, file)
-        if not gmd_file.endswith('.gmd'):
-            continue
-        if not os.path.isdir(gmd_file):
-            continue
+    dumps = find_dumps(unpack_dir)
+    packed: Dict[str, bytes] = dict()
+
+    def write(gmd_file: str, blob: bytes) -> None:
+        file = dump_path(unpack_dir, gmd_file)
+        if arc_file is None:
+            write_gmd(pack_dir, file, blob)
+        else:
+            packed[file] = blob
 
-        gmd = GMD()
-        with open(os.path.join(gmd_file, 'info.json'), 'r') as f:
-            gmd_info = json.load(f)
-        gmd.name = gmd_info['name']
-        gmd.padding = gmd_info['padding']
+    pipeline.run(dumps, load_dump, GMD.to_bytes, write,
+                 jobs=jobs, readers=readers, depth=depth)
 
-        scripts: List[Tuple[int, str, str]] = list()
-        for section_file in os.listdir(gmd_file):
-            if not section_file.endswith('.txt'):
+    if arc_file is None:
+        return
+
+    with open(arc_file, 'rb') as f:
+        arc = Arc.load(f)
+        entries = [e for e in arc.entries if e.ext == 'gmd']
+        by_path = {e.path.replace('\\', '/'): e for e in entries}
+        base_names: Dict[str, List[ArcEntry]] = dict()
+        for e in entries:
+            base_names.setdefault(e.base_name, list()).append(e)
+
+        blobs: Dict[str, bytes] = dict()
+        for file, blob in packed.items():
+            # Dumps are matched by path in the archive, or by base name for
+            # dumps unpacked without it
+            if file in by_path:
+                blobs[by_path[file].path] = blob
                 continue
-            regex = re.compile(r"(\d+)-(.+).txt")
-            result = re.match(regex, section_file)
-            section_id = int(result.group(1))
-            section_name = result.group(2)
+            matches = base_names.get(file, list())
+            if len(matches) > 1:
+                raise ValueError(
+                    f"{file} matches several entries of {arc_file}: "
+                    + ', '.join(e.path for e in matches))
+            if len(matches) == 1:
+                blobs[matches[0].path] = blob
+
+        # Unchanged GMDs keep their original compressed data
+        replaced = {
+            e.path: blobs[e.path]
+            for e in entries
+            if e.path in blobs and blobs[e.path] != arc.read(e)
+        }
+        for path in replaced:
+            print(path)
+        arc.save(os.path.join(pack_dir, os.path.basename(arc_file)),
+                 replaced)
 
-            scripts.append((section_id,
-                            section_name,
-                            os.path.join(gmd_file, section_file)))
 
-        scripts.sort(key=lambda s: s[0])
+def _patch(data: Tuple[bytes, Dict[str, bytes]]) -> bytes:
+    return GMD.patch(*data)
 
-        for script in scripts:
-            with open(script[2], 'rb') as f:
-                gmd.add_section(GMDSection(script[0], script[1], f.read()))
 
-        gmd.pack(pack_dir, file)
+def patch_gmds(gmd_dir: str, patch_file: str, pack_dir: str,
+               jobs: int = 1, readers: int = 4, depth: int = 16) -> None:
+    # Only the patched files are written
+    with open(patch_file, 'r', encoding='UTF-8') as f:
+        patches: Dict[str, Dict[str, str]] = json.load(f)
+
+    def read(file: str) -> Tuple[bytes, Dict[str, bytes]]:
+        changes = {
+            key: text.encode('UTF-8') for key, text in patches[file].items()
+        }
+        return pipeline.read_file(os.path.join(gmd_dir, file)), changes
+
+    os.makedirs(pack_dir, exist_ok=True)
+    pipeline.run(patches.keys(), read, _patch,
+                 lambda file, blob: write_gmd(pack_dir, file, blob),
+                 jobs=jobs, readers=readers, depth=depth)
+
+
+def export_db(gmd_dir: str, db_file: str, jobs: int = 1,
+              readers: int = 4, depth: int = 16) -> None:
+    store = TextStore(db_file)
+    try:
+        imported, unchanged, removed = store.update(
+            gmd_dir, jobs=jobs, readers=readers, depth=depth)
+    finally:
+        store.close()
+    print(f"Imported {imported}, unchanged {unchanged}, removed {removed}")
+
+
+def search_db(db_file: str, query: str, limit: int = 100) -> None:
+    store = TextStore(db_file)
+    try:
+        for file, section_id, label, text in store.search(query, limit):
+            print(f"{file}:{section_id}-{label}: {printable(text)}")
+    finally:
+        store.close()
+
+
+def import_db(db_file: str, pack_dir: str, changed: bool = False) -> None:
+    os.makedirs(pack_dir, exist_ok=True)
+
+    store = TextStore(db_file)
+    try:
+        files = store.changed() if changed else None
+        for file, gmd in store.iter_gmds(files):
+            write_gmd(pack_dir, file, gmd.to_bytes())
+    finally:
+        store.close()
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    if args.command == 'unpack':
-        unpack_gmds(args.gmd[0], args.o[0])
-    elif args.command == 'repack':
-        repack_gmds(args.res[0], args.o[0])
-    else:
-        parser.print_help()
+    with profiling.session(args):
+        if args.command in ('unpack', 'repack', 'patch', 'export', 'diff'):
+            options = dict(jobs=args.jobs, readers=args.readers,
+                           depth=args.queue_depth)
+        if args.command == 'unpack':
+            unpack_gmds(args.gmd[0], args.o[0], dump_format=args.format,
+                        **options)
+        elif args.command == 'repack':
+            repack_gmds(args.res[0], args.o[0],
+                        arc_file=args.arc[0] if args.arc else None,
+                        **options)
+        elif args.command == 'patch':
+            patch_gmds(args.gmd[0], args.p[0], args.o[0], **options)
+        elif args.command == 'export':
+            export_db(args.gmd[0], args.d[0], **options)
+        elif args.command == 'search':
+            search_db(args.db[0], args.query[0], limit=args.limit)
+        elif args.command == 'import':
+            import_db(args.db[0], args.o[0], changed=args.changed)
+        elif args.command == 'diff':
+            diff_dirs(args.old[0], args.new[0],
+                      out_file=args.o[0] if args.o else None, **options)
+        else:
+            parser.print_help()
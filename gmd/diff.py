@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .. import pipeline
+from .gmd import GMD
+from .texts import printable
+
+Report = Dict[str, object]
+
+
+def find_gmds(gmd_dir: str) -> List[str]:
+    # Paths relative to gmd_dir, to match files of both trees
+    return [os.path.relpath(path, gmd_dir)
+            for path in pipeline.find_files(gmd_dir, ('.gmd',))]
+
+
+def _by_label(content: bytes) -> Dict[str, Tuple[int, bytes, bytes]]:
+    # Label -> (section id, text, hash), repeated labels get a #n suffix
+    sections: Dict[str, Tuple[int, bytes, bytes]] = dict()
+    for i, (label, text) in enumerate(GMD.raw_sections(content)):
+        key, n = label, 1
+        while key in sections:
+            n += 1
+            key = f"{label}#{n}"
+        sections[key] = (i, text, hashlib.sha1(text).digest())
+    return sections
+
+
+def _decode(text: bytes) -> str:
+    return text.decode('UTF-8', 'surrogateescape')
+
+
+def diff_gmd(data: Tuple[Optional[bytes], Optional[bytes]]) \
+        -> Optional[Report]:
+    # None if both files are the same, texts are only decoded for
+    # modified sections
+    old, new = data
+    if old == new:
+        return None
+    if old is None:
+        return {'status': 'added'}
+    if new is None:
+        return {'status': 'removed'}
+
+    old_sections = _by_label(old)
+    new_sections = _by_label(new)
+    added = [{'label': label, 'id': new_sections[label][0]}
+             for label in new_sections if label not in old_sections]
+    removed = [{'label': label, 'id': old_sections[label][0]}
+               for label in old_sections if label not in new_sections]
+
+    modified: List[Dict[str, object]] = list()
+    for label, (new_id, new_text, new_hash) in new_sections.items():
+        if label not in old_sections:
+            continue
+        old_id, old_text, old_hash = old_sections[label]
+        if old_hash == new_hash:
+            continue
+        modified.append({
+            'label': label,
+            'old_id': old_id,
+            'new_id': new_id,
+            'old_hash': old_hash.hex(),
+            'new_hash': new_hash.hex(),
+            'old': _decode(old_text),
+            'new': _decode(new_text)
+        })
+
+    return {
+        'status': 'modified',
+        'added': added,
+        'removed': removed,
+        'modified': modified
+    }
+
+
+def diff_dirs(old_dir: str, new_dir: str, out_file: Optional[str] = None,
+              jobs: int = 1, readers: int = 4,
+              depth: int = 16) -> Dict[str, Report]:
+    files = sorted(set(find_gmds(old_dir)).union(find_gmds(new_dir)))
+
+    def read(file: str) -> Tuple[Optional[bytes], Optional[bytes]]:
+        return tuple(
+            pipeline.read_file(os.path.join(gmd_dir, file))
+            if os.path.isfile(os.path.join(gmd_dir, file)) else None
+            for gmd_dir in (old_dir, new_dir)
+        )
+
+    report: Dict[str, Report] = dict()
+    for file, result in pipeline.imap(files, read, diff_gmd, jobs=jobs,
+                                      readers=readers, depth=depth):
+        if result is not None:
+            report[file] = result
+
+    if out_file is None:
+        print(printable(json.dumps(report, ensure_ascii=False, indent=1)))
+        return report
+
+    # Bytes that are not UTF-8 are written back as they were read
+    with open(out_file, 'w', encoding='UTF-8', errors='surrogateescape') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+
+    counts = {'added': 0, 'removed': 0, 'modified': 0}
+    for file, result in report.items():
+        counts[result['status']] += 1
+        if result['status'] != 'modified':
+            print(f"{result['status']}: {file}")
+            continue
+        print(f"modified: {file} (+{len(result['added'])}"
+              f" -{len(result['removed'])} ~{len(result['modified'])})")
+    print(f"{len(files)} files, {counts['added']} added,"
+          f" {counts['removed']} removed, {counts['modified']} modified")
+    return report
@@ -3,13 +3,18 @@ from __future__ import annotations
 import json
 import os
 import struct
-from typing import List
+from array import array
+from io import BytesIO
+from typing import Dict, List, Tuple, Union
 
+from ..profiling import count, traced
 from .crc32 import Crc32
 from .xor import XOR
 
 
 class GMDSection(object):
+    __slots__ = ('id', 'name', 'text')
+
     def __init__(self, section_id: int,
                  section_name: str, section_text: bytes) -> None:
         self.id = section_id
@@ -28,6 +33,10 @@ class GMDSection(object):
 
 class GMD(object):
     class _Header(object):
+        __slots__ = ('magic', 'version', 'language', 'padding',
+                     'label_count', 'section_count', 'label_size',
+                     'section_size', 'name_size')
+
         def __init__(self,
                      magic: bytes,
                      version: bytes,
@@ -67,6 +76,9 @@ class GMD(object):
             )
 
     class _Label(object):
+        __slots__ = ('section_id', 'hash1', 'hash2', 'label_offset',
+                     'list_link')
+
         def __init__(self,
                      section_id: int,
                      hash1: int,
@@ -122,72 +134,190 @@ class GMD(object):
         self.padding = 0
         self.labels: List[GMD._Label] = list()
         self.sections: List[GMDSection] = list()
-        self.buckets = [0 for _ in range(0x100)]
+        self.buckets = array('i', [0]) * 0x100
         self.__label_offset = 0
 
     @staticmethod
     def __read_cstr(data: bytes, offset: int):
-        end_offset = offset
-        while data[end_offset] != 0x00:
-            end_offset += 1
-        return data[offset:end_offset]
+        return data[offset:data.index(b'\x00', offset)]
 
     @staticmethod
-    def load(f) -> GMD:
-        gmd = GMD()
-        content = f.read()
-        offset = 0
-
-        gmd.header = GMD._Header.load(content)
-        gmd.padding = gmd.header.padding
-        offset += 40
-
-        gmd.name = content[offset:offset+gmd.header.name_size].decode('UTF-8')
-        offset += gmd.header.name_size + 1
-
-        for _ in range(gmd.header.label_count):
-            gmd.labels.append(GMD._Label.load(content[offset:]))
-            offset += 20
-
-        bucket_size = 0x100 if gmd.header.label_count > 0 else 0
-        gmd.buckets = list()
-        for _ in range(bucket_size):
-            gmd.buckets.append(struct.unpack_from('<i', content[offset:])[0])
-            offset += 4
+    def __parse_tables(content: bytes) \
+            -> Tuple[GMD._Header, List[GMD._Label], array, int, int]:
+        # Returns header, labels, buckets, label data and text offsets
+        header = GMD._Header.load(content)
+        offset = 40 + header.name_size + 1
+
+        label_table = content[offset:offset + header.label_count * 20]
+        labels = [
+            GMD._Label(*fields)
+            for fields in struct.iter_unpack('<iIIii', label_table)
+        ]
+        offset += len(label_table)
+
+        bucket_size = 0x100 if header.label_count > 0 else 0
+        buckets = array(
+            'i', struct.unpack_from(f"<{bucket_size}i", content, offset))
+        offset += bucket_size * 4
         label_data_offset = offset
 
         text_offset = (
             + 0x28
-            + (gmd.header.name_size + 1)
-            + (gmd.header.label_count * 0x14)
+            + (header.name_size + 1)
+            + (header.label_count * 0x14)
             + bucket_size * 4
-            + gmd.header.label_size
+            + header.label_size
         )
+        return header, labels, buckets, label_data_offset, text_offset
+
+    @staticmethod
+    def __section_names(content: bytes, labels: List[GMD._Label],
+                        label_data_offset: int,
+                        section_count: int) -> List[str]:
+        label_offsets = {
+            label.section_id: label.label_offset for label in labels
+        }
+
+        names: List[str] = list()
+        no_name_count = 0
+        for i in range(section_count):
+            pos = label_offsets.get(i)
+            if pos is None:
+                names.append(f"no_name_{no_name_count}")
+                no_name_count += 1
+                continue
+            label_name = GMD.__read_cstr(content, label_data_offset + pos)
+            names.append(label_name.decode('UTF-8'))
+        return names
+
+    @staticmethod
+    @traced('gmd.raw_sections')
+    def raw_sections(content: bytes) -> List[Tuple[str, bytes]]:
+        # (label, de-XORed text) of each section, without decoding texts
+        header, labels, _, label_data_offset, text_offset = \
+            GMD.__parse_tables(content)
+        names = GMD.__section_names(content, labels, label_data_offset,
+                                    header.section_count)
+        if header.section_count == 0:
+            return list()
+        raw_text = XOR.dexor(
+            content[text_offset:text_offset + header.section_size])
+        texts = raw_text.split(b'\x00')[:header.section_count]
+        return list(zip(names, texts))
+
+    @staticmethod
+    def load_header(f) -> GMD:
+        # Header and name only, without labels and texts
+        gmd = GMD()
+        gmd.header = GMD._Header.load(f.read(40))
+        assert gmd.header.magic == b'GMD\x00'
+        gmd.padding = gmd.header.padding
+        gmd.name = f.read(gmd.header.name_size).decode('UTF-8')
+        return gmd
+
+    @staticmethod
+    @traced('gmd.load')
+    def load(f) -> GMD:
+        gmd = GMD()
+        content = f.read()
+
+        gmd.header, gmd.labels, gmd.buckets, label_data_offset, text_offset = \
+            GMD.__parse_tables(content)
+        gmd.padding = gmd.header.padding
+        gmd.name = content[40:40+gmd.header.name_size].decode('UTF-8')
+
         offset = text_offset
         obfs_text = content[offset:offset+gmd.header.section_size]
         raw_text = XOR.dexor(obfs_text)
 
+        names = GMD.__section_names(content, gmd.labels, label_data_offset,
+                                    gmd.header.section_count)
         section_offset = 0
-        no_name_count = 0
-        for i in range(gmd.header.section_count):
+        for i, label_name in enumerate(names):
             section_text = GMD.__read_cstr(raw_text, section_offset)
             section_offset += len(section_text) + 1
 
-            has_name = False
-            for label in filter(lambda l: l.section_id == i, gmd.labels):
-                has_name = True
-                pos = label.label_offset
-                label_name = GMD.__read_cstr(content, label_data_offset + pos)
-                label_name = label_name.decode('UTF-8')
-
-            if not has_name:
-                label_name = f"no_name_{no_name_count}"
-                no_name_count += 1
-
             gmd.sections.append(GMDSection(i, label_name, section_text))
 
+        count('gmd.sections', gmd.header.section_count)
         return gmd
 
+    @staticmethod
+    def from_bytes(content: bytes) -> GMD:
+        return GMD.load(BytesIO(content))
+
+    @staticmethod
+    async def aload(path: str) -> GMD:
+        from .. import aio
+
+        return await aio.run(GMD.from_bytes, await aio.read(path))
+
+    @staticmethod
+    @traced('gmd.patch')
+    def patch(content: bytes, changes: Dict[Union[int, str], bytes]) -> bytes:
+        # Replaces section texts (by label or id) of a packed GMD, keeping
+        # the header, labels and buckets; the result equals a full repack
+        header, labels, _, label_data_offset, text_offset = \
+            GMD.__parse_tables(content)
+        section_ids: Dict[str, int] = dict()
+        if any(isinstance(key, str) for key in changes):
+            names = GMD.__section_names(content, labels, label_data_offset,
+                                        header.section_count)
+            section_ids = {name: i for i, name in enumerate(names)}
+
+        updates: Dict[int, bytes] = dict()
+        for key, text in changes.items():
+            if key in section_ids:
+                section_id = section_ids[key]
+            elif str(key).isdigit() and int(key) < header.section_count:
+                section_id = int(key)
+            else:
+                raise KeyError(f"No section {key}")
+            text = text.replace(b'\r\n', b'\n')
+            updates[section_id] = text.replace(b'\n', b'\r\n')
+
+        if len(updates) == 0:
+            return content
+
+        text_end = text_offset + header.section_size
+        obfs_text = content[text_offset:text_end]
+        raw_text = XOR.dexor(obfs_text)
+        # Stored as plain text, a repack obfuscates all of it
+        rexor_all = obfs_text[-1] == 0
+        if raw_text.count(b'\n') != raw_text.count(b'\r\n'):
+            # A repack also turns bare \n into \r\n in unchanged sections
+            raw_text = raw_text.replace(b'\r\n', b'\n')
+            raw_text = raw_text.replace(b'\n', b'\r\n')
+            rexor_all = True
+
+        first = min(updates)
+        offset = 0
+        for _ in range(first):
+            offset = raw_text.index(b'\x00', offset) + 1
+        prefix_size = offset
+
+        tail: List[bytes] = list()
+        for i in range(first, header.section_count):
+            end = raw_text.index(b'\x00', offset)
+            tail.append(updates.get(i, raw_text[offset:end]) + b'\x00')
+            offset = end + 1
+        tail_blob = b''.join(tail)
+
+        if rexor_all:
+            new_text = XOR.rexor(raw_text[:prefix_size] + tail_blob)
+        else:
+            new_text = (obfs_text[:prefix_size]
+                        + XOR.rexor(tail_blob, prefix_size))
+
+        header.section_size = len(new_text)
+        return b''.join([
+            header.dump(),
+            content[40:text_offset],
+            new_text,
+            content[text_end:]
+        ])
+
+    @traced('gmd.export')
     def export(self, dump_name) -> None:
         os.makedirs(dump_name, exist_ok=True)
 
@@ -203,15 +333,50 @@ class GMD(object):
             with open(os.path.join(dump_name, file_name), 'wb') as f:
                 f.write(s.text)
 
+    @traced('gmd.export')
+    def export_jsonl(self, dump_file: str) -> None:
+        # One JSON line for name and padding, then one line per section;
+        # bytes that are not UTF-8 are kept with surrogateescape
+        with open(dump_file, 'w', encoding='UTF-8',
+                  errors='surrogateescape') as f:
+            f.write(json.dumps({'name': self.name, 'padding': self.padding},
+                               ensure_ascii=False))
+            f.write('\n')
+            for s in self.sections:
+                f.write(json.dumps({
+                    'id': s.id,
+                    'label': s.name,
+                    'text': s.text.decode('UTF-8', 'surrogateescape')
+                }, ensure_ascii=False))
+                f.write('\n')
+
+    @staticmethod
+    @traced('gmd.load_jsonl')
+    def load_jsonl(dump_file: str) -> GMD:
+        gmd = GMD()
+        with open(dump_file, 'r', encoding='UTF-8',
+                  errors='surrogateescape') as f:
+            info = json.loads(f.readline())
+            gmd.name = info['name']
+            gmd.padding = info['padding']
+            for line in f:
+                s = json.loads(line)
+                gmd.add_section(GMDSection(
+                    s['id'], s['label'],
+                    s['text'].encode('UTF-8', 'surrogateescape')))
+        return gmd
+
     def add_section(self, section: GMDSection) -> None:
-        counter = len(self.sections)
-        if counter == 0:
-            counter = -1
         self.sections.append(section)
 
         if section.name.startswith('no_name_'):
             return
 
+        # Buckets and list links refer to labels, not sections
+        counter = len(self.labels)
+        if counter == 0:
+            counter = -1
+
         label = GMD._Label.create(section.id,
                                   section.name,
                                   self.__label_offset)
@@ -224,7 +389,8 @@ class GMD(object):
         else:
             self.buckets[bucket] = counter
 
-    def pack(self, pack_path: str, pack_name: str) -> None:
+    @traced('gmd.pack')
+    def to_bytes(self) -> bytes:
         text_blob = b''.join(
             [s.text + b'\x00' for s in self.sections]
         )
@@ -232,11 +398,11 @@ class GMD(object):
         text_blob = text_blob.replace(b'\n', b'\r\n')
         text_blob = XOR.rexor(text_blob)
 
+        # Same sections as add_section gave a label to
         label_blob = b''.join(
-            [s.name.encode('UTF-8') + b'\x00' for s in self.sections]
+            [s.name.encode('UTF-8') + b'\x00' for s in self.sections
+             if not s.name.startswith('no_name_')]
         )
-        if len(self.labels) == 0:
-            label_blob = b''
 
         self.header = GMD._Header(
             magic=b'GMD\x00',
@@ -250,21 +416,29 @@ class GMD(object):
             name_size=len(self.name)
         )
 
-        print(pack_name)
-        with open(os.path.join(pack_path, pack_name), 'wb') as f:
-            f.write(self.header.dump())
+        blob = [self.header.dump(), self.name.encode('UTF-8'), b'\x00']
+
+        for label in self.labels:
+            blob.append(label.dump())
+
+        # print(self.buckets)
+        if self.header.label_count > 0:
+            blob.append(struct.pack('<256i', *self.buckets))
 
-            f.write(self.name.encode('UTF-8'))
-            f.write(b'\x00')
+        if self.header.label_count > 0:
+            blob.append(label_blob)
 
-            for label in self.labels:
-                f.write(label.dump())
+        blob.append(text_blob)
+        return b''.join(blob)
 
-            # print(self.buckets)
-            if self.header.label_count > 0:
-                f.write(struct.pack('<256i', *self.buckets))
+    async def asave(self, path: str) -> None:
+        from .. import aio
 
-            if self.header.label_count > 0:
-                f.write(label_blob)
+        await aio.write(path, await aio.run(self.to_bytes))
 
-            f.write(text_blob)
+    def pack(self, pack_path: str, pack_name: str) -> None:
+        blob = self.to_bytes()
+
+        print(pack_name)
+        with open(os.path.join(pack_path, pack_name), 'wb') as f:
+            f.write(blob)
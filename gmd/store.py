@@ -0,0 +1,210 @@
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .. import pipeline
+from .gmd import GMD, GMDSection
+
+# SQLite only takes valid UTF-8 strings, other texts are kept as BLOBs
+DBText = Union[str, bytes]
+Section = Tuple[int, str, DBText, str]
+
+
+def to_db(text: bytes) -> DBText:
+    try:
+        return text.decode('UTF-8')
+    except UnicodeDecodeError:
+        return text
+
+
+def from_db(text: DBText) -> bytes:
+    return text if isinstance(text, bytes) else text.encode('UTF-8')
+
+
+def text_hash(text: DBText) -> str:
+    return hashlib.sha1(from_db(text)).hexdigest()
+
+
+def _parse_gmd(data: Tuple[str, Optional[bytes]]) \
+        -> Tuple[str, Optional[GMD], List[Section]]:
+    # Content is None for files whose hash did not change
+    digest, content = data
+    if content is None:
+        return digest, None, list()
+
+    gmd = GMD.from_bytes(content)
+    sections: List[Section] = list()
+    for s in gmd.sections:
+        text = to_db(s.text)
+        sections.append((s.id, s.name, text, text_hash(text)))
+    # Texts are returned separately, the GMD only carries name and header
+    gmd.sections = list()
+    return digest, gmd, sections
+
+
+class TextStore(object):
+    def __init__(self, db_file: str) -> None:
+        self.conn = sqlite3.connect(db_file)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS gmds (
+                file TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                padding INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sections (
+                file TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                text TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                edited INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (file, id)
+            );
+        ''')
+        columns = [row[1] for row in self.conn.execute(
+            'PRAGMA table_info(sections)')]
+        if 'edited' not in columns:
+            # Databases from before the edited marker, hashed once here
+            with self.conn:
+                self.conn.execute('ALTER TABLE sections ADD COLUMN'
+                                  ' edited INTEGER NOT NULL DEFAULT 0')
+                self.conn.executemany(
+                    'UPDATE sections SET edited = 1 WHERE rowid = ?',
+                    ((rowid,) for rowid, text, digest in self.conn.execute(
+                        'SELECT rowid, text, hash FROM sections').fetchall()
+                     if text_hash(text) != digest))
+        self.conn.execute('CREATE INDEX IF NOT EXISTS sections_edited'
+                          ' ON sections (file) WHERE edited')
+        try:
+            # Trigrams match inside Japanese text without word breaks
+            self.__create_fts("tokenize='trigram'")
+        except sqlite3.OperationalError:
+            # SQLite before 3.34
+            self.__create_fts("tokenize='unicode61'")
+
+        # Keeps the full-text index in sync with the sections
+        self.conn.executescript('''
+            CREATE TRIGGER IF NOT EXISTS sections_ai AFTER INSERT
+            ON sections BEGIN
+                INSERT INTO sections_fts (rowid, text)
+                VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS sections_ad AFTER DELETE
+            ON sections BEGIN
+                INSERT INTO sections_fts (sections_fts, rowid, text)
+                VALUES ('delete', old.rowid, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS sections_au AFTER UPDATE
+            ON sections BEGIN
+                INSERT INTO sections_fts (sections_fts, rowid, text)
+                VALUES ('delete', old.rowid, old.text);
+                INSERT INTO sections_fts (rowid, text)
+                VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS sections_edit AFTER UPDATE OF text
+            ON sections WHEN new.hash = old.hash AND new.edited = old.edited
+                AND new.text != old.text
+            BEGIN
+                UPDATE sections SET edited = 1 WHERE rowid = new.rowid;
+            END;
+        ''')
+
+    def __create_fts(self, options: str) -> None:
+        self.conn.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5('
+            f"text, content='sections', content_rowid='rowid', {options})")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def update(self, gmd_dir: str, jobs: int = 1, readers: int = 4,
+               depth: int = 16) -> Tuple[int, int, int]:
+        # Returns numbers of (imported, unchanged, removed) files, texts
+        # edited in the database are kept unless the GMD section changed
+        known: Dict[str, str] = dict(
+            self.conn.execute('SELECT file, hash FROM gmds'))
+
+        # Paths relative to gmd_dir with / separators
+        files = [os.path.relpath(path, gmd_dir).replace(os.sep, '/')
+                 for path in pipeline.find_files(gmd_dir, ('.gmd',))]
+
+        def read(file: str) -> Tuple[str, Optional[bytes]]:
+            content = pipeline.read_file(
+                os.path.join(gmd_dir, *file.split('/')))
+            digest = hashlib.sha1(content).hexdigest()
+            if digest == known.get(file):
+                return digest, None
+            return digest, content
+
+        removed = set(known.keys()).difference(files)
+        imported = 0
+        with self.conn:
+            for file in removed:
+                self.conn.execute('DELETE FROM sections WHERE file = ?',
+                                  (file,))
+                self.conn.execute('DELETE FROM gmds WHERE file = ?', (file,))
+
+            for file, (digest, gmd, sections) in pipeline.imap(
+                    files, read, _parse_gmd,
+                    jobs=jobs, readers=readers, depth=depth):
+                if gmd is None:
+                    continue
+                imported += 1
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO gmds VALUES (?, ?, ?, ?)',
+                    (file, gmd.name, gmd.padding, digest))
+
+                old: Dict[int, Tuple[str, str]] = {
+                    section_id: (label, section_hash)
+                    for section_id, label, section_hash in self.conn.execute(
+                        'SELECT id, label, hash FROM sections'
+                        ' WHERE file = ?', (file,))
+                }
+                self.conn.execute(
+                    'DELETE FROM sections WHERE file = ? AND id >= ?',
+                    (file, len(sections)))
+                self.conn.executemany(
+                    'INSERT INTO sections (file, id, label, text, hash)'
+                    ' VALUES (?, ?, ?, ?, ?) ON CONFLICT (file, id) DO UPDATE'
+                    ' SET label = excluded.label, text = excluded.text,'
+                    ' hash = excluded.hash, edited = 0',
+                    ((file, *s) for s in sections
+                     if old.get(s[0]) != (s[1], s[3])))
+
+        return imported, len(files) - imported, len(removed)
+
+    def search(self, query: str,
+               limit: int = 100) -> List[Tuple[str, int, str, str]]:
+        # Returns (file, id, label, text) of matching sections, bytes that
+        # are not UTF-8 are decoded as lone surrogates
+        return [(file, section_id, label,
+                 from_db(text).decode('UTF-8', 'surrogateescape'))
+                for file, section_id, label, text in self.conn.execute(
+                    'SELECT s.file, s.id, s.label, s.text FROM sections_fts'
+                    ' JOIN sections AS s ON s.rowid = sections_fts.rowid'
+                    ' WHERE sections_fts MATCH ?'
+                    ' ORDER BY s.file, s.id LIMIT ?', (query, limit))]
+
+    def changed(self) -> List[str]:
+        # Files with texts edited since they were imported, marked by the
+        # sections_edit trigger as update always changes the hash too
+        return [file for file, in self.conn.execute(
+            'SELECT DISTINCT file FROM sections WHERE edited ORDER BY file')]
+
+    def iter_gmds(self, files: List[str] = None) -> Iterator[Tuple[str, GMD]]:
+        if files is None:
+            files = [file for file, in self.conn.execute(
+                'SELECT file FROM gmds ORDER BY file')]
+
+        for file in files:
+            gmd = GMD()
+            gmd.name, gmd.padding = self.conn.execute(
+                'SELECT name, padding FROM gmds WHERE file = ?',
+                (file,)).fetchone()
+            for section_id, label, text in self.conn.execute(
+                    'SELECT id, label, text FROM sections'
+                    ' WHERE file = ? ORDER BY id', (file,)):
+                gmd.add_section(GMDSection(section_id, label, from_db(text)))
+            yield file, gmd
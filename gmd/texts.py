@@ -0,0 +1,156 @@
+import json
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from ..profiling import span
+from .gmd import GMD, GMDSection
+
+# Control tags such as <COL RED> take no space on screen
+TAG = re.compile(r'<[^>]*>')
+SECTION_FILE = re.compile(r"(\d+)-(.+).txt")
+JSONL = '.jsonl'
+# Bytes that are not UTF-8, as decoded with surrogateescape
+UNDECODABLE = ''.join(chr(c) for c in range(0xdc80, 0xdd00))
+
+
+def printable(text: str) -> str:
+    # Undecodable bytes are shown as U+FFFD, printing surrogates fails
+    return text.encode('UTF-8', 'surrogateescape').decode('UTF-8', 'replace')
+
+
+def find_sources(text_dir: str) -> List[str]:
+    # GMD files, JSON lines dumps, or unpacked directories holding
+    # section texts
+    sources: List[str] = list()
+
+    for dir_path, dir_names, file_names in os.walk(text_dir):
+        dir_names.sort()
+        if any(name.endswith('.txt') for name in file_names):
+            sources.append(dir_path)
+        for name in sorted(file_names):
+            if name.endswith('.gmd') or name.endswith('.gmd.jsonl'):
+                sources.append(os.path.join(dir_path, name))
+
+    return sources
+
+
+def read_texts(source: str,
+               chunk_size: Optional[int] = None) -> Iterator[str]:
+    # Texts from files are split into chunks if chunk_size is given
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if not name.endswith('.txt'):
+                continue
+            yield from read_texts(os.path.join(source, name), chunk_size)
+    elif source.endswith('.txt'):
+        with open(source, 'r', encoding='UTF-8',
+                  errors='surrogateescape') as f:
+            if chunk_size is None:
+                yield f.read()
+                return
+            chunk = f.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = f.read(chunk_size)
+    else:
+        if source.endswith('.jsonl'):
+            gmd = GMD.load_jsonl(source)
+        else:
+            with open(source, 'rb') as f:
+                gmd = GMD.load(f)
+        for s in gmd.sections:
+            yield s.text.decode('UTF-8', 'surrogateescape')
+
+
+def read_sections(source: str) -> List[Tuple[str, str]]:
+    # (section, text) pairs, sections named like the unpacked text files
+    if os.path.isdir(source):
+        return [(name[:-len('.txt')], text)
+                for name in sorted(os.listdir(source))
+                if name.endswith('.txt')
+                for text in read_texts(os.path.join(source, name))]
+
+    if source.endswith('.jsonl'):
+        gmd = GMD.load_jsonl(source)
+    else:
+        with open(source, 'rb') as f:
+            gmd = GMD.load(f)
+    return [(f"{s.id}-{s.name}", s.text.decode('UTF-8', 'surrogateescape'))
+            for s in gmd.sections]
+
+
+def strip_tags(text: str) -> str:
+    # Text as displayed, without tags and carriage returns
+    return TAG.sub('', text).replace('\r', '')
+
+
+def load_unpacked(gmd_file: str) -> GMD:
+    gmd = GMD()
+    with open(os.path.join(gmd_file, 'info.json'), 'r') as f:
+        gmd_info = json.load(f)
+    gmd.name = gmd_info['name']
+    gmd.padding = gmd_info['padding']
+
+    scripts: List[Tuple[int, str, str]] = list()
+    for section_file in os.listdir(gmd_file):
+        if not section_file.endswith('.txt'):
+            continue
+        # Other files, such as editor backups, are not sections
+        result = SECTION_FILE.match(section_file)
+        if result is None:
+            continue
+        section_id = int(result.group(1))
+        section_name = result.group(2)
+
+        scripts.append((section_id,
+                        section_name,
+                        os.path.join(gmd_file, section_file)))
+
+    scripts.sort(key=lambda s: s[0])
+
+    with span('gmd.read'):
+        for script in scripts:
+            with open(script[2], 'rb') as f:
+                gmd.add_section(GMDSection(script[0], script[1], f.read()))
+
+    return gmd
+
+
+def find_dumps(unpack_dir: str) -> List[str]:
+    # Unpacked GMD directories and JSON lines dumps, also in subdirectories
+    # (GMDs of ARC files are unpacked under their path in the archive)
+    dumps: List[str] = list()
+    for dir_path, dir_names, file_names in os.walk(unpack_dir):
+        dir_names.sort()
+        dumps.extend(os.path.join(dir_path, name) for name in dir_names
+                     if name.endswith('.gmd'))
+        dumps.extend(os.path.join(dir_path, name)
+                     for name in sorted(file_names)
+                     if name.endswith('.gmd' + JSONL))
+        dir_names[:] = [name for name in dir_names
+                        if not name.endswith('.gmd')]
+    return dumps
+
+
+def dump_path(unpack_dir: str, dump: str) -> str:
+    # Path of the GMD a dump was unpacked from, relative and with / separators
+    path = os.path.relpath(dump, unpack_dir).replace(os.sep, '/')
+    if path.endswith(JSONL):
+        path = path[:-len(JSONL)]
+    return path
+
+
+def load_dump(gmd_file: str) -> GMD:
+    if gmd_file.endswith(JSONL):
+        return GMD.load_jsonl(gmd_file)
+    return load_unpacked(gmd_file)
+
+
+def write_gmd(pack_dir: str, file: str, blob: bytes) -> None:
+    # file may be a path with / separators, directories are created
+    print(file)
+    out_file = os.path.join(pack_dir, *file.split('/'))
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    with open(out_file, 'wb') as f:
+        f.write(blob)
@@ -1,44 +1,49 @@
-from typing import List
+from math import gcd
+
+from ..profiling import count, traced
+
+
+def _key_stream(key1: bytes, key2: bytes) -> bytes:
+    # Both keys combined, repeating every lcm(len(key1), len(key2)) bytes
+    period = len(key1) * len(key2) // gcd(len(key1), len(key2))
+    return bytes(
+        key1[i % len(key1)] ^ key2[i % len(key2)] for i in range(period)
+    )
 
 
 class XOR(object):
     key1 = b"e43bcc7fcab+a6c4ed22fcd433/9d2e6cb053fa462-463f3a446b19"
     key2 = b"861f1dca05a0;9ddd5261e5dcc@6b438e6c.8ba7d71c*4fd11f3af1"
 
+    __stream = _key_stream(key1, key2)
+    __period = len(__stream)
+
+    @staticmethod
+    def __apply(text: bytes, start: int) -> bytes:
+        period = XOR.__period
+        begin = start % period
+        repeat = (begin + len(text)) // period + 1
+        key = (XOR.__stream * repeat)[begin:begin + len(text)]
+        value = int.from_bytes(text, 'little') ^ int.from_bytes(key, 'little')
+        return value.to_bytes(len(text), 'little')
+
     @staticmethod
+    @traced('xor.dexor')
     def dexor(text: bytes) -> bytes:
+        count('xor.bytes', len(text))
         last_byte = text[-1]
         if last_byte == 0:
             return text
 
-        check = (
-            last_byte
-            ^ XOR.key1[(len(text) - 1) % len(XOR.key1)]
-            ^ XOR.key2[(len(text) - 1) % len(XOR.key2)]
-        )
+        check = last_byte ^ XOR.__stream[(len(text) - 1) % XOR.__period]
         if check != 0:
             raise ValueError("Cannot dexor")
 
-        ret: List[int] = list()
-        for i in range(len(text)):
-            b = text[i]
-            b = (
-                b
-                ^ XOR.key1[i % len(XOR.key1)]
-                ^ XOR.key2[i % len(XOR.key2)]
-            )
-            ret.append(b)
-        return bytes(ret)
+        return XOR.__apply(text, 0)
 
     @staticmethod
-    def rexor(text: bytes) -> bytes:
-        ret: List[int] = list()
-        for i in range(len(text)):
-            b = text[i]
-            b = (
-                b
-                ^ XOR.key1[i % len(XOR.key1)]
-                ^ XOR.key2[i % len(XOR.key2)]
-            )
-            ret.append(b)
-        return bytes(ret)
+    @traced('xor.rexor')
+    def rexor(text: bytes, start: int = 0) -> bytes:
+        # start is the offset of text in the whole text block
+        count('xor.bytes', len(text))
+        return XOR.__apply(text, start)
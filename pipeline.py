@@ -0,0 +1,151 @@
+import argparse
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from typing import (Callable, Deque, Iterable, Iterator, List, Optional,
+                    Tuple)
+
+# Items go through reader threads, then worker processes (or the calling
+# thread if jobs is 1), then the consumer. At most `depth` items wait
+# between two stages, so memory stays bounded whatever the number of
+# items. (item, result) pairs come out in the order of the items.
+_END = object()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--jobs', metavar='n', type=int, default=1,
+                        help='Number of worker processes')
+
+    parser.add_argument('--readers', metavar='n', type=int, default=4,
+                        help='Number of reader threads')
+
+    parser.add_argument('--queue-depth', metavar='n', type=int, default=16,
+                        help='Maximum number of items between two stages')
+
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def find_files(root: str, extensions: Tuple[str, ...]) -> List[str]:
+    # Paths under root with one of the extensions, in sorted walk order
+    files: List[str] = list()
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for name in sorted(file_names):
+            if name.endswith(extensions):
+                files.append(os.path.join(dir_path, name))
+    return files
+
+
+def imap(items: Iterable,
+         read: Optional[Callable],
+         process: Optional[Callable],
+         jobs: int = 1, readers: int = 4, depth: int = 16,
+         executor: Optional[Executor] = None) -> Iterator:
+    # read runs in threads, process must be picklable if jobs > 1. A given
+    # executor is used instead of a new pool of jobs processes, and is left
+    # running, so its workers stay warm between calls
+    depth = max(depth, 1)
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+    reads: queue.Queue = queue.Queue()
+
+    read_pool = ThreadPoolExecutor(max(readers, 1))
+    work_pool = executor
+    if work_pool is None and jobs > 1:
+        work_pool = ProcessPoolExecutor(jobs)
+
+    def feed() -> None:
+        try:
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                if read is None:
+                    future: Future = Future()
+                    future.set_result(item)
+                else:
+                    future = read_pool.submit(read, item)
+                reads.put((item, future))
+        except BaseException as e:
+            future = Future()
+            future.set_exception(e)
+            reads.put((None, future))
+        reads.put(_END)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    pending: Deque[Tuple[object, Future]] = deque()
+    try:
+        while True:
+            entry = reads.get()
+            if entry is _END:
+                break
+            item, future = entry
+            data = future.result()
+            slots.release()
+
+            if process is None:
+                yield item, data
+            elif work_pool is None:
+                yield item, process(data)
+            else:
+                pending.append((item, work_pool.submit(process, data)))
+                if len(pending) >= depth:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    finally:
+        stop.set()
+        slots.release()
+        feeder.join()
+        read_pool.shutdown(cancel_futures=True)
+        if work_pool is not None and work_pool is not executor:
+            work_pool.shutdown(cancel_futures=True)
+
+
+def run(items: Iterable,
+        read: Optional[Callable],
+        process: Optional[Callable],
+        write: Callable,
+        jobs: int = 1, readers: int = 4, depth: int = 16,
+        executor: Optional[Executor] = None) -> None:
+    # write(item, result) runs in one thread, in the order of the items
+    writes: queue.Queue = queue.Queue(max(depth, 1))
+    errors: List[BaseException] = list()
+
+    def drain() -> None:
+        while True:
+            entry = writes.get()
+            if entry is _END:
+                return
+            if len(errors) > 0:
+                continue
+            try:
+                write(*entry)
+            except BaseException as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=drain)
+    writer.start()
+    try:
+        for entry in imap(items, read, process, jobs=jobs, readers=readers,
+                          depth=depth, executor=executor):
+            if len(errors) > 0:
+                break
+            writes.put(entry)
+    finally:
+        writes.put(_END)
+        writer.join()
+
+    if len(errors) > 0:
+        raise errors[0]
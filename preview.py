@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .cache import ObjectCache, open_gmd
+from .gfd.gfd import GFD
+from .gmd.gmd import GMD
+from .gmd.texts import strip_tags
+from .tex.mt_tex import MTTex
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m preview',
+    description='Serve GMD sections rendered with the game font as PNG.'
+)
+
+parser.add_argument('text', metavar='text_dir', type=str, nargs=1,
+                    help='GMD files or unpacked texts directory')
+
+parser.add_argument('-f', metavar='gfd_file', type=str, nargs=1,
+                    help='GFD file of the text font', required=True)
+
+parser.add_argument('-t', metavar='tex_dir', type=str, nargs=1,
+                    help='TEX files directory (default: GFD directory)')
+
+parser.add_argument('-w', metavar='pixels', type=int, nargs=1,
+                    help='Text box width, marked on the previews')
+
+parser.add_argument('--host', metavar='address', type=str,
+                    default='127.0.0.1', help='Address to listen on')
+
+parser.add_argument('--port', metavar='n', type=int, default=8000,
+                    help='Port to listen on')
+
+BACKGROUND = (32, 32, 48)
+FOREGROUND = (255, 255, 255)
+BOX_MARK = (255, 64, 64)
+MARGIN = 4
+
+
+class Preview(object):
+    def __init__(self, gfd_file: str, tex_dir: Optional[str] = None,
+                 box_width: Optional[int] = None, line_spacing: int = 4,
+                 atlas_limit: int = 64 << 20, image_cache: int = 256) -> None:
+        with open(gfd_file, 'rb') as f:
+            self.gfd = GFD.load(f)
+
+        base_name = os.path.splitext(os.path.basename(gfd_file))[0]
+        self.tex_name = os.path.join(
+            tex_dir if tex_dir is not None else os.path.dirname(gfd_file),
+            f"{base_name}_{{:02d}}_AM_NOMIP.tex")
+        self.box_width = box_width
+        self.line_height = self.gfd.header.size_px + line_spacing
+
+        # Decoded pages as alpha planes, reloaded if the TEX file changes
+        self.atlases = ObjectCache(atlas_limit)
+        # Rendered PNGs by text, shared by all sections with the same text
+        self.render_png = lru_cache(maxsize=image_cache)(self.__render_png)
+        self.__labels: Dict[str, Tuple[GMD, Dict[str, int]]] = dict()
+        self.__lock = threading.Lock()
+
+    def atlas(self, page: int) -> Image.Image:
+        from PIL import Image
+
+        size, alpha = self.atlases.get(self.tex_name.format(page),
+                                       MTTex.load_alpha)
+        return Image.frombuffer('L', size, alpha, 'raw', 'L', 0, 1)
+
+    def layout(self, text: str) \
+            -> Tuple[Tuple[int, int], Dict[int, List[Tuple]]]:
+        # Image size, and glyph boxes with their places grouped by page
+        size_px = self.gfd.header.size_px
+        lines = strip_tags(text).split('\n')
+        pages: Dict[int, List[Tuple]] = dict()
+        width = 0
+        for row, line in enumerate(lines):
+            x = 0
+            y = row * self.line_height + size_px
+            for char in line:
+                g = self.gfd.find(char)
+                if g is None:
+                    x += size_px
+                    continue
+                box = (g.pos[0], g.pos[1],
+                       g.pos[0] + g.size[0], g.pos[1] + g.size[1])
+                pages.setdefault(g.tex, list()).append(
+                    (box, (MARGIN + x, MARGIN + y - g.pos_off[1])))
+                x += g.pos_off[0] + g.pos_add[0]
+            width = max(width, x)
+
+        if self.box_width is not None:
+            width = max(width, self.box_width)
+        return (width + 2 * MARGIN,
+                len(lines) * self.line_height + 2 * MARGIN), pages
+
+    def render(self, text: str) -> Image.Image:
+        from PIL import Image
+
+        size, pages = self.layout(text)
+        mask = Image.new('L', size)
+        for page, glyphs in pages.items():
+            atlas = self.atlas(page)
+            for box, place in glyphs:
+                mask.paste(255, place, atlas.crop(box))
+
+        image = Image.new('RGB', size, BACKGROUND)
+        image.paste(FOREGROUND, (0, 0), mask)
+        if self.box_width is not None:
+            x = MARGIN + self.box_width
+            image.paste(BOX_MARK, (x, 0, x + 1, size[1]))
+        return image
+
+    def __render_png(self, text: str) -> bytes:
+        out = BytesIO()
+        self.render(text).save(out, 'PNG', compress_level=1)
+        return out.getvalue()
+
+    def section_text(self, path: str, section: str) -> str:
+        # Section by id or label, from a GMD file or an unpacked directory
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                stem = name[:-len('.txt')]
+                if name.endswith('.txt') and \
+                        section in (stem, *stem.split('-', 1)):
+                    with open(os.path.join(path, name), 'rb') as f:
+                        return f.read().decode('UTF-8', 'surrogateescape')
+            raise KeyError(section)
+
+        gmd = open_gmd(path)
+        with self.__lock:
+            cached = self.__labels.get(path)
+            if cached is None or cached[0] is not gmd:
+                cached = gmd, {s.name: i for i, s in enumerate(gmd.sections)}
+                self.__labels[path] = cached
+        labels = cached[1]
+
+        if section in labels:
+            index = labels[section]
+        elif section.isdigit() and int(section) < len(gmd.sections):
+            index = int(section)
+        else:
+            raise KeyError(section)
+        return gmd.sections[index].text.decode('UTF-8', 'surrogateescape')
+
+    def stats(self) -> Dict[str, object]:
+        images = self.render_png.cache_info()
+        return {
+            'atlases': self.atlases.stats(),
+            'images': {
+                'hits': images.hits,
+                'misses': images.misses,
+                'entries': images.currsize,
+                'limit': images.maxsize
+            }
+        }
+
+
+def make_handler(preview: Preview, text_dir: str) -> type:
+    root = os.path.realpath(text_dir)
+
+    class Handler(BaseHTTPRequestHandler):
+        # GET /<gmd or unpacked dir>/<section id or label>.png
+        # GET /render.png?text=...   GET /stats   GET /
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            path = unquote(url.path).strip('/')
+            try:
+                if path == '':
+                    self.send(200, 'application/json', json.dumps(
+                        self.sources(), ensure_ascii=False).encode('UTF-8'))
+                elif path == 'stats':
+                    self.send(200, 'application/json',
+                              json.dumps(preview.stats()).encode('UTF-8'))
+                elif path == 'render.png':
+                    text = parse_qs(url.query).get('text', [''])[0]
+                    self.send(200, 'image/png', preview.render_png(text))
+                elif path.endswith('.png'):
+                    source, _, section = path[:-len('.png')].rpartition('/')
+                    source = os.path.realpath(os.path.join(root, source))
+                    if not source.startswith(root + os.sep):
+                        raise KeyError(path)
+                    text = preview.section_text(source, section)
+                    self.send(200, 'image/png', preview.render_png(text))
+                else:
+                    raise KeyError(path)
+            except (KeyError, FileNotFoundError):
+                self.send(404, 'text/plain', b'Not found')
+            except Exception as e:
+                # Such as a file under the root that is not a GMD
+                self.send(500, 'text/plain', repr(e).encode('UTF-8'))
+
+        def sources(self) -> List[str]:
+            sources: List[str] = list()
+            for dir_path, dir_names, file_names in os.walk(root):
+                dir_names.sort()
+                if any(name.endswith('.txt') for name in file_names):
+                    sources.append(os.path.relpath(dir_path, root))
+                sources.extend(
+                    os.path.relpath(os.path.join(dir_path, name), root)
+                    for name in sorted(file_names) if name.endswith('.gmd'))
+            return sources
+
+        def send(self, status: int, content_type: str, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return Handler
+
+
+def serve(preview: Preview, text_dir: str,
+          host: str = '127.0.0.1', port: int = 8000) -> None:
+    server = ThreadingHTTPServer((host, port), make_handler(preview, text_dir))
+    print(f"Serving previews on http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    preview = Preview(args.f[0],
+                      tex_dir=args.t[0] if args.t else None,
+                      box_width=args.w[0] if args.w else None)
+    try:
+        serve(preview, args.text[0], args.host, args.port)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,163 @@
+import argparse
+import cProfile
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Spans and counters are only recorded in the process calling start(),
+# work done in pool workers is not included.
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_spans: Dict[Tuple[str, ...], List[float]] = dict()
+_counters: Dict[str, int] = dict()
+_null = nullcontext()
+
+
+class _Span(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = list()
+        stack.append(self.name)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.start
+        stack: List[str] = _local.stack
+        path = tuple(stack)
+        stack.pop()
+        with _lock:
+            record = _spans.setdefault(path, [0.0, 0])
+            record[0] += elapsed
+            record[1] += 1
+
+
+def span(name: str):
+    if not _enabled:
+        return _null
+    return _Span(name)
+
+
+def traced(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: int = 1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def start() -> None:
+    global _enabled
+    _spans.clear()
+    _counters.clear()
+    _enabled = True
+
+
+def stop() -> None:
+    global _enabled
+    _enabled = False
+
+
+def report() -> Dict[str, object]:
+    spans = list()
+    for path, (seconds, calls) in sorted(_spans.items()):
+        children = sum(
+            s[0] for p, s in _spans.items()
+            if len(p) == len(path) + 1 and p[:-1] == path
+        )
+        spans.append({
+            'path': list(path),
+            'calls': calls,
+            'seconds': seconds,
+            'self_seconds': max(seconds - children, 0.0)
+        })
+    return {'spans': spans, 'counters': dict(_counters)}
+
+
+def dump(out_file: str, extra: Dict[str, object] = None) -> None:
+    data = report()
+    if out_file.endswith('.folded'):
+        # Collapsed stacks in microseconds, for flamegraph tools
+        with open(out_file, 'w') as f:
+            for s in data['spans']:
+                micros = int(s['self_seconds'] * 1e6)
+                if micros > 0:
+                    f.write(f"{';'.join(s['path'])} {micros}\n")
+        return
+
+    if extra is not None:
+        data.update(extra)
+    with open(out_file, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--profile', metavar='report_file', type=str,
+                        nargs=1, help='Write timing report (JSON, or '
+                                      'collapsed stacks if .folded)')
+
+    parser.add_argument('--profile-mode', type=str, default='spans',
+                        choices=['spans', 'cprofile', 'tracemalloc'],
+                        help='Also run cProfile (to report_file.prof) '
+                             'or tracemalloc')
+
+
+@contextmanager
+def session(args: argparse.Namespace) -> Iterator[None]:
+    if args.profile is None:
+        yield
+        return
+
+    out_file = args.profile[0]
+    extra: Dict[str, object] = dict()
+    profiler = None
+    if args.profile_mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif args.profile_mode == 'tracemalloc':
+        tracemalloc.start()
+
+    start()
+    try:
+        yield
+    finally:
+        stop()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(f"{out_file}.prof")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:20]
+            tracemalloc.stop()
+            extra['memory'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [
+                    {'where': str(stat.traceback), 'bytes': stat.size,
+                     'count': stat.count}
+                    for stat in top
+                ]
+            }
+        dump(out_file, extra)
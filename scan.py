@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import struct
+from typing import Dict, Iterator, List
+
+from . import pipeline
+from .gfd.gfd import GFD
+from .gmd.gmd import GMD
+from .tex.mt_tex import MTTex
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m scan',
+    description='Index GMD, GFD and TEX files by their headers.'
+)
+
+parser.add_argument('dir', metavar='asset_dir', type=str, nargs=1,
+                    help='Directory to scan recursively')
+
+parser.add_argument('-o', metavar='output_file', type=str, nargs=1,
+                    help='Output JSON lines index', required=True)
+
+pipeline.add_arguments(parser)
+# Scanning only reads headers, more readers keep the disk busy
+parser.set_defaults(readers=16, queue_depth=64)
+
+EXTENSIONS = ('.gmd', '.gfd', '.tex')
+
+
+def scan_file(path: str) -> Dict[str, object]:
+    entry: Dict[str, object] = {
+        'path': path,
+        'type': os.path.splitext(path)[1][1:]
+    }
+
+    try:
+        entry['size'] = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if entry['type'] == 'gmd':
+                gmd = GMD.load_header(f)
+                entry.update({
+                    'name': gmd.name,
+                    'language': gmd.header.language,
+                    'labels': gmd.header.label_count,
+                    'sections': gmd.header.section_count,
+                    'text_size': gmd.header.section_size
+                })
+            elif entry['type'] == 'gfd':
+                gfd = GFD.load_header(f)
+                entry.update({
+                    'name': gfd.name,
+                    'size_px': gfd.header.size_px,
+                    'bitmaps': gfd.header.bitmap_count,
+                    'glyphs': gfd.header.entry_count
+                })
+            else:
+                tex = MTTex.load_header(f)
+                entry.update({
+                    'version': tex.header.version,
+                    'format': tex.header.format,
+                    'alpha_flags': tex.header.alpha_flags,
+                    'width': tex.header.width,
+                    'height': tex.header.height,
+                    'mips': tex.mip_maps
+                })
+    except (AssertionError, OSError, UnicodeDecodeError, ValueError,
+            struct.error) as e:
+        entry['error'] = repr(e)
+
+    return entry
+
+
+def find_assets(asset_dir: str) -> List[str]:
+    return pipeline.find_files(asset_dir, EXTENSIONS)
+
+
+def scan_dir(asset_dir: str, out_file: str, readers: int = 16,
+             depth: int = 64) -> None:
+    assets = find_assets(asset_dir)
+
+    counts: Dict[str, int] = dict()
+    with open(out_file, 'w', encoding='UTF-8') as f:
+        def write(path: str, entry: Dict[str, object]) -> None:
+            entry['path'] = os.path.relpath(path, asset_dir)
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write('\n')
+            counts[entry['type']] = counts.get(entry['type'], 0) + 1
+
+        # Headers are read in the reader threads, nothing to process so
+        # --jobs has no effect
+        pipeline.run(assets, scan_file, None, write,
+                     readers=readers, depth=depth)
+
+    for asset_type, n in sorted(counts.items()):
+        print(f"{asset_type}: {n}")
+    print(f"Total: {len(assets)}")
+
+
+def read_index(index_file: str, asset_type: str = None) \
+        -> Iterator[Dict[str, object]]:
+    with open(index_file, 'r', encoding='UTF-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if asset_type is None or entry['type'] == asset_type:
+                yield entry
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    scan_dir(args.dir[0], args.o[0], readers=args.readers,
+             depth=args.queue_depth)
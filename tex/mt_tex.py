@@ -1,18 +1,33 @@
 from __future__ import annotations
 
 import struct
-from io import BufferedReader
+from functools import lru_cache
+from io import BufferedReader, BytesIO
 from typing import List, Tuple
 
-from PIL import Image
-
+from ..profiling import count, span, traced
 from .bin_util import bit_cut, bit_merge
 from .img_util import la04_encode, la04_loader
 from .swizzle import ctr_swizzle
 
+# 4 bit alpha of the low and high nibble, scaled to 8 bits
+_LOW_ALPHA = bytes((b & 0xf) * 0x11 for b in range(0x100))
+_HIGH_ALPHA = bytes((b >> 4) * 0x11 for b in range(0x100))
+
+
+@lru_cache(maxsize=8)
+def _linear_order(width: int, height: int) -> List[int]:
+    # Swizzled index of each pixel in row order
+    swizzle = ctr_swizzle(width, height)
+    return [swizzle.inverse[i] for i in range(width * height)]
+
 
 class MTTex(object):
     class _Header(object):
+        __slots__ = ('magic', 'version', 'unused1', 'unknown1', 'alpha_flags',
+                     'map_cnt', 'width', 'height', 'unknown2', 'format',
+                     'unknown3')
+
         def __init__(self,
                      magic: bytes = b'',
                      version: int = 0,
@@ -57,35 +72,72 @@ class MTTex(object):
 
     def __init__(self) -> None:
         self.header = MTTex._Header()
+        self.mip_maps: List[int] = list()
         self.bmp_data: List[Tuple[int, int, int, int]] = list()
 
     @staticmethod
-    def load(f: BufferedReader) -> MTTex:
+    def load_header(f: BufferedReader) -> MTTex:
+        # Header and mip map table only, without pixels
         tex = MTTex()
         tex.header = MTTex._Header.from_bytes(f.read(16))
         assert tex.header.magic == b'TEX\x00'
+
+        tex.mip_maps = list(struct.unpack(
+            f"<{tex.header.map_cnt}I", f.read(4 * tex.header.map_cnt)))
+        return tex
+
+    @staticmethod
+    @traced('tex.load')
+    def load(f: BufferedReader) -> MTTex:
+        tex = MTTex.load_header(f)
         assert tex.header.format == 14     # LA(0, 4)
         assert tex.header.version == 0xa6  # 3DSv3
-
-        mip_maps = [
-            struct.unpack_from('<I', f.read(4))[0]
-            for _ in range(tex.header.map_cnt)
-        ]
-        assert len(mip_maps) == 1
+        assert len(tex.mip_maps) == 1
 
         data_blob = f.read()
-        px_swizzled = la04_loader(data_blob)
+        with span('tex.decode'):
+            px_swizzled = la04_loader(data_blob)
 
         assert len(px_swizzled) == tex.header.width * tex.header.height
         tex.bmp_data = [(0, 0, 0, 0) for _ in range(len(px_swizzled))]
 
-        swizzle = ctr_swizzle(tex.header.width, tex.header.height)
+        with span('tex.swizzle'):
+            swizzle = ctr_swizzle(tex.header.width, tex.header.height)
 
-        for i, px in enumerate(px_swizzled):
-            tex.bmp_data[swizzle[i]] = px
+            for i, px in enumerate(px_swizzled):
+                tex.bmp_data[swizzle[i]] = px
 
+        count('tex.pixels_swizzled', len(px_swizzled))
         return tex
 
+    @staticmethod
+    def from_bytes(content: bytes) -> MTTex:
+        return MTTex.load(BytesIO(content))
+
+    @staticmethod
+    async def aload(path: str) -> MTTex:
+        from .. import aio
+
+        return await aio.run(MTTex.from_bytes, await aio.read(path))
+
+    @staticmethod
+    @traced('tex.load_alpha')
+    def load_alpha(f: BufferedReader) -> Tuple[Tuple[int, int], bytes]:
+        # Size and 8 bit alpha plane in row order, without building pixels
+        tex = MTTex.load_header(f)
+        assert tex.header.format == 14     # LA(0, 4)
+        assert len(tex.mip_maps) == 1
+        size = tex.header.width, tex.header.height
+
+        data_blob = f.read(size[0] * size[1] // 2)
+        swizzled = bytearray(2 * len(data_blob))
+        swizzled[0::2] = data_blob.translate(_LOW_ALPHA)
+        swizzled[1::2] = data_blob.translate(_HIGH_ALPHA)
+
+        order = _linear_order(*size)
+        count('tex.pixels_swizzled', len(order))
+        return size, bytes(map(swizzled.__getitem__, order))
+
     @staticmethod
     def new(size: Tuple[int, int], bmp: List[Tuple[int, int, int]]) -> MTTex:
         tex = MTTex()
@@ -104,18 +156,37 @@ class MTTex(object):
         return tex
 
     def export_png(self, png_name: str) -> None:
+        from PIL import Image
+
         image = Image.new(mode='RGBA',
                           size=(self.header.width, self.header.height))
         image.putdata(self.bmp_data)
         image.save(png_name)
 
-    def export_tex(self, tex_name: str) -> None:
-        swizzled_data = [(0, 0, 0, 0) for _ in range(len(self.bmp_data))]
-        swizzle = ctr_swizzle(self.header.width, self.header.height)
-        for i, px in enumerate(self.bmp_data):
-            swizzled_data[swizzle.inverse[i]] = px
+    @traced('tex.pack')
+    def to_bytes(self) -> bytes:
+        with span('tex.swizzle'):
+            swizzled_data = [(0, 0, 0, 0) for _ in range(len(self.bmp_data))]
+            swizzle = ctr_swizzle(self.header.width, self.header.height)
+            for i, px in enumerate(self.bmp_data):
+                swizzled_data[swizzle.inverse[i]] = px
+        count('tex.pixels_swizzled', len(swizzled_data))
+
+        with span('tex.encode'):
+            data_blob = la04_encode(swizzled_data)
+
+        return b''.join([
+            self.header.to_bytes(),
+            struct.pack('<I', 0),
+            data_blob
+        ])
 
+    def export_tex(self, tex_name: str) -> None:
+        blob = self.to_bytes()
         with open(tex_name, 'wb') as f:
-            f.write(self.header.to_bytes())
-            f.write(struct.pack('<I', 0))
-            f.write(la04_encode(swizzled_data))
+            f.write(blob)
+
+    async def asave(self, tex_name: str) -> None:
+        from .. import aio
+
+        await aio.write(tex_name, await aio.run(self.to_bytes))
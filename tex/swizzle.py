@@ -1,4 +1,6 @@
+from functools import lru_cache
 from typing import List, Tuple
+
 from bidict import bidict
 
 
@@ -51,7 +53,9 @@ class MasterSwizzle(object):
         return ret
 
 
+@lru_cache(maxsize=8)
 def ctr_swizzle(width: int, height: int) -> bidict[int, int]:
+    # Shared between calls with the same size, do not modify
     swizzle = MasterSwizzle(width, (0, 0),
                             [(1, 0), (0, 1), (2, 0), (0, 2), (4, 0), (0, 4)])
 
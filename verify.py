@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import pipeline
+from .gfd.gfd import GFD
+from .gmd.gmd import GMD, GMDSection
+from .gmd.xor import XOR
+from .scan import find_assets
+from .tex.mt_tex import MTTex
+from .tex.swizzle import ctr_swizzle
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m verify',
+    description='Check that GMD, GFD and TEX files repack to the same bytes.'
+)
+
+parser.add_argument('dir', metavar='asset_dir', type=str, nargs=1,
+                    help='Directory to check recursively')
+
+parser.add_argument('-o', metavar='report_file', type=str, nargs=1,
+                    help='Output JSON lines report of failed files')
+
+pipeline.add_arguments(parser)
+
+
+def repack_gmd(content: bytes) -> bytes:
+    # Same steps as unpack then repack, without the text files
+    gmd = GMD.from_bytes(content)
+    repacked = GMD()
+    repacked.name = gmd.name
+    repacked.padding = gmd.padding
+    for s in gmd.sections:
+        repacked.add_section(GMDSection(s.id, s.name, s.text))
+    return repacked.to_bytes()
+
+
+def repack_gfd(content: bytes) -> bytes:
+    return GFD.from_bytes(content).to_bytes()
+
+
+def repack_tex(content: bytes) -> bytes:
+    return MTTex.from_bytes(content).to_bytes()
+
+
+def locate_gmd(content: bytes, offset: int) -> str:
+    header = GMD._Header.load(content)
+    label_table = 40 + header.name_size + 1
+    buckets = label_table + header.label_count * 20
+    label_names = buckets + (0x400 if header.label_count > 0 else 0)
+    text = label_names + header.label_size
+
+    if offset < 40:
+        return 'header'
+    if offset < label_table:
+        return 'name'
+    if offset < buckets:
+        return f"label {(offset - label_table) // 20}"
+    if offset < label_names:
+        return f"bucket {(offset - buckets) // 4}"
+    if offset < text:
+        return 'label names'
+    if offset >= text + header.section_size:
+        return 'end of file'
+
+    raw_text = XOR.dexor(content[text:text + header.section_size])
+    section_id = raw_text.count(b'\x00', 0, offset - text)
+    return f"text, section {section_id}"
+
+
+def locate_gfd(content: bytes, offset: int) -> str:
+    header = GFD._Header.from_bytes(content[:0x40])
+    glyphs = 0x40 + header.name_length + 1
+    if offset < 0x40:
+        return 'header'
+    if offset < glyphs:
+        return 'name'
+    return f"glyph {(offset - glyphs) // 20}"
+
+
+def locate_tex(content: bytes, offset: int) -> str:
+    header = MTTex._Header.from_bytes(content[:16])
+    data = 16 + 4 * header.map_cnt
+    if offset < 16:
+        return 'header'
+    if offset < data:
+        return f"mip map {(offset - 16) // 4}"
+
+    # Two 4 bit pixels per byte, in swizzled order
+    index = 2 * (offset - data)
+    if index >= header.width * header.height:
+        return 'end of file'
+    swizzle = ctr_swizzle(header.width, header.height)
+    x, y = swizzle[index] % header.width, swizzle[index] // header.width
+    return f"pixels at ({x}, {y})"
+
+
+CODECS = {
+    'gmd': (repack_gmd, locate_gmd),
+    'gfd': (repack_gfd, locate_gfd),
+    'tex': (repack_tex, locate_tex),
+}
+
+
+def first_difference(a: bytes, b: bytes, block: int = 1 << 12) -> int:
+    for start in range(0, min(len(a), len(b)), block):
+        if a[start:start + block] != b[start:start + block]:
+            for i in range(start, min(start + block, len(a), len(b))):
+                if a[i] != b[i]:
+                    return i
+    return min(len(a), len(b))
+
+
+def verify_file(data: Tuple[str, Union[bytes, str]]) -> Dict[str, object]:
+    asset_type, content = data
+    repack, locate = CODECS[asset_type]
+    result: Dict[str, object] = {'type': asset_type}
+
+    if isinstance(content, str):
+        result['error'] = content
+        return result
+
+    try:
+        repacked = repack(content)
+    except (AssertionError, UnicodeDecodeError, ValueError, KeyError,
+            struct.error) as e:
+        result['error'] = repr(e)
+        return result
+
+    if content == repacked:
+        return result
+
+    offset = first_difference(content, repacked)
+    result.update({
+        'offset': offset,
+        'where': locate(content, offset),
+        'size': len(content),
+        'repacked_size': len(repacked)
+    })
+    return result
+
+
+def read_asset(path: str) -> Tuple[str, Union[bytes, str]]:
+    # Content is the error for files that could not be read
+    asset_type = os.path.splitext(path)[1][1:]
+    try:
+        return asset_type, pipeline.read_file(path)
+    except OSError as e:
+        return asset_type, repr(e)
+
+
+def verify_dir(asset_dir: str, report_file: Optional[str] = None,
+               jobs: int = 1, readers: int = 4, depth: int = 16) -> int:
+    # Returns the number of files that failed
+    assets = find_assets(asset_dir)
+
+    failed: List[Dict[str, object]] = list()
+    for path, result in pipeline.imap(assets, read_asset, verify_file,
+                                      jobs=jobs, readers=readers,
+                                      depth=depth):
+        if 'error' in result:
+            print(f"{path}: {result['error']}")
+        elif 'offset' in result:
+            print(f"{path}: differs at {result['offset']:#x}"
+                  f" ({result['where']}), {result['size']}"
+                  f" -> {result['repacked_size']} bytes")
+        else:
+            continue
+        result['path'] = os.path.relpath(path, asset_dir)
+        failed.append(result)
+
+    if report_file is not None:
+        with open(report_file, 'w', encoding='UTF-8') as f:
+            for result in failed:
+                f.write(json.dumps(result, ensure_ascii=False))
+                f.write('\n')
+
+    print(f"Verified: {len(assets) - len(failed)}, failed: {len(failed)}")
+    return len(failed)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    failures = verify_dir(args.dir[0],
+                          report_file=args.o[0] if args.o else None,
+                          jobs=args.jobs, readers=args.readers,
+                          depth=args.queue_depth)
+    sys.exit(1 if failures > 0 else 0)
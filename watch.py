@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import pipeline
+from .gfd.generator import (FONT_CONFIG, FontJob, OutputCache, OutputFile,
+                            find_fonts, generate_font, load_font_config,
+                            load_jobs, load_ttf, report_font, write_files)
+from .gmd.gmd import GMD
+from .gmd.texts import JSONL, dump_path, load_dump, write_gmd
+
+parser = argparse.ArgumentParser(
+    prog='python3 -m watch',
+    description='Repack GMDs and regenerate fonts when their sources change.'
+)
+
+parser.add_argument('-o', metavar='output_dir', type=str, nargs=1,
+                    help='Output directory', required=True)
+
+parser.add_argument('-u', metavar='unpacked_dir', type=str, nargs=1,
+                    help='Unpacked GMD directories or JSON lines dumps')
+
+parser.add_argument('-i', metavar='res_dir', type=str, nargs=1,
+                    help='Font resources directory')
+
+parser.add_argument('-f', metavar='font', type=str, nargs=1,
+                    help='TrueType font file, required with -i')
+
+parser.add_argument('--layout', metavar='layout_file', type=str, nargs=1,
+                    help='JSON list of glyph placing order')
+
+parser.add_argument('--interval', metavar='seconds', type=float,
+                    default=0.25, help='Polling interval')
+
+parser.add_argument('--debounce', metavar='seconds', type=float,
+                    default=0.2, help='Quiet time before rebuilding')
+
+parser.add_argument('--jobs', metavar='n', type=int, default=1,
+                    help='Number of worker processes, started once and '
+                         'kept between rebuilds (1: work in this process)')
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+class Watcher(object):
+    def __init__(self, out_dir: str,
+                 unpack_dir: Optional[str] = None,
+                 res_dir: Optional[str] = None,
+                 font_name: Optional[str] = None,
+                 layout_file: Optional[str] = None,
+                 jobs: int = 1) -> None:
+        if res_dir is not None and font_name is None:
+            raise ValueError("A TrueType font is needed to generate fonts")
+
+        self.out_dir = out_dir
+        self.unpack_dir = unpack_dir
+        self.res_dir = res_dir
+        self.font_name = font_name
+        self.layout_file = layout_file
+        self.jobs = jobs
+        # Worker processes are started once and reused by every rebuild
+        self.executor: Optional[ProcessPoolExecutor] = None
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(jobs)
+
+        # Parsed sources, kept between rebuilds
+        self.gmds: Dict[str, GMD] = dict()
+        self.sections: Dict[str, Dict[str, int]] = dict()
+        self.fonts: Dict[str, FontJob] = dict()
+        self.font_deps: Dict[str, Set[str]] = dict()
+
+        os.makedirs(out_dir, exist_ok=True)
+        self.outputs = OutputCache(out_dir)
+        self.snapshot = self.scan()
+        for dump in {self.gmd_target(path) for path in self.snapshot}:
+            if dump is not None:
+                self.try_update(dump, self.load_gmd, dump)
+        if res_dir is not None:
+            self.try_update(res_dir, self.load_fonts,
+                            list(find_fonts(res_dir).keys()))
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def try_update(self, source: str, update: Callable, *args) -> bool:
+        # A source that fails to load (malformed or half written) is
+        # reported, what was loaded before it stays as it was
+        try:
+            update(*args)
+        except Exception as e:
+            print(f"{source}: {e!r}")
+            return False
+        return True
+
+    def scan(self) -> Snapshot:
+        snapshot: Snapshot = dict()
+
+        def add(path: str) -> None:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+        if self.unpack_dir is not None:
+            for dir_path, _, file_names in os.walk(self.unpack_dir):
+                for name in file_names:
+                    add(os.path.join(dir_path, name))
+        if self.res_dir is not None:
+            for name in os.listdir(self.res_dir):
+                add(os.path.join(self.res_dir, name))
+            add(self.font_name)
+            if self.layout_file is not None:
+                add(self.layout_file)
+        return snapshot
+
+    def gmd_target(self, path: str) -> Optional[str]:
+        # The dump directory or JSON lines file a source file belongs to
+        if self.unpack_dir is None:
+            return None
+        rel = os.path.relpath(path, self.unpack_dir)
+        if rel.startswith('..'):
+            return None
+
+        # Dumps of ARC entries are in subdirectories
+        parts = rel.split(os.sep)
+        for i, part in enumerate(parts):
+            if part.endswith('.gmd' + JSONL) or \
+                    (part.endswith('.gmd') and i < len(parts) - 1):
+                return os.path.join(self.unpack_dir, *parts[:i + 1])
+        return None
+
+    def load_gmd(self, dump: str) -> None:
+        if not os.path.exists(dump):
+            self.gmds.pop(dump, None)
+            self.sections.pop(dump, None)
+            return
+
+        gmd = load_dump(dump)
+        self.gmds[dump] = gmd
+        self.sections[dump] = {
+            f"{s.id}-{s.name}.txt": i for i, s in enumerate(gmd.sections)
+        }
+
+    def update_gmd(self, dump: str, paths: Set[str]) -> None:
+        # Edited section texts are replaced in the loaded GMD, anything
+        # else (new, removed or renamed files) reloads the whole dump
+        sections = self.sections.get(dump)
+        if sections is None or not os.path.isdir(dump):
+            self.load_gmd(dump)
+            return
+
+        for path in paths:
+            index = sections.get(os.path.basename(path))
+            if index is None or not os.path.isfile(path):
+                self.load_gmd(dump)
+                return
+
+        texts: Dict[int, bytes] = dict()
+        for path in paths:
+            with open(path, 'rb') as f:
+                texts[sections[os.path.basename(path)]] = f.read()
+
+        gmd = self.gmds[dump]
+        for index, text in texts.items():
+            gmd.sections[index].text = text
+
+    def load_fonts(self, font_indices: List[str]) -> None:
+        fonts = find_fonts(self.res_dir)
+        font_indices = [i for i in font_indices if i in fonts]
+        jobs = load_jobs(self.res_dir, font_indices, self.layout_file)
+        self.fonts.update(zip(font_indices, jobs))
+        for index in set(self.fonts).difference(fonts):
+            del self.fonts[index]
+
+        # Source files of each font, as resolved by load_jobs
+        config = load_font_config(self.res_dir)
+        self.font_deps = dict()
+        for index, base_name in fonts.items():
+            font_config = config.get(index, dict())
+            deps = [
+                f"{base_name}_header.bin",
+                font_config.get('list', f"{base_name}_list.json")
+            ]
+            if 'layout' in font_config:
+                deps.append(font_config['layout'])
+            for dep in deps:
+                path = os.path.join(self.res_dir, dep)
+                self.font_deps.setdefault(path, set()).add(index)
+
+    def poll(self) -> Set[str]:
+        snapshot = self.scan()
+        changed = {
+            path for path in set(snapshot).union(self.snapshot)
+            if snapshot.get(path) != self.snapshot.get(path)
+        }
+        self.snapshot = snapshot
+        return changed
+
+    def rebuild(self, changed: Set[str]) -> None:
+        start = time.perf_counter()
+
+        dumps: Dict[str, Set[str]] = dict()
+        font_indices: Set[str] = set()
+        reload_all = False
+        for path in changed:
+            dump = self.gmd_target(path)
+            if dump is not None:
+                dumps.setdefault(dump, set()).add(path)
+            elif self.res_dir is None:
+                continue
+            elif path == self.font_name:
+                load_ttf.cache_clear()
+                if self.executor is not None:
+                    # Workers have the old faces cached
+                    self.executor.shutdown()
+                    self.executor = ProcessPoolExecutor(self.jobs)
+                font_indices.update(self.fonts.keys())
+            elif path in self.font_deps:
+                font_indices.update(self.font_deps[path])
+            elif path.endswith('_header.bin') or path in (
+                    os.path.join(self.res_dir, FONT_CONFIG),
+                    self.layout_file):
+                # Fonts added or removed, or settings of all fonts
+                reload_all = True
+
+        gmds = [dump for dump in sorted(dumps)
+                if self.try_update(dump, self.update_gmd, dump, dumps[dump])
+                and dump in self.gmds]
+
+        if reload_all:
+            font_indices = set(find_fonts(self.res_dir).keys())
+        if len(font_indices) > 0 and not self.try_update(
+                self.res_dir, self.load_fonts, sorted(font_indices)):
+            font_indices = set()
+
+        pipeline.run(gmds, self.gmds.get, GMD.to_bytes, self.__write_gmd,
+                     jobs=self.jobs, executor=self.executor)
+
+        jobs = [self.fonts[i] for i in sorted(font_indices)
+                if i in self.fonts]
+        if len(jobs) > 0:
+            try:
+                pipeline.run(jobs, None,
+                             partial(generate_font, self.font_name,
+                                     self.outputs.known()),
+                             self.__write_font, jobs=self.jobs,
+                             executor=self.executor)
+            finally:
+                self.outputs.save()
+
+        elapsed = time.perf_counter() - start
+        print(f"Rebuilt {len(gmds)} GMDs and {len(jobs)} fonts"
+              f" in {elapsed:.3f} s")
+
+    def __write_gmd(self, dump: str, blob: bytes) -> None:
+        write_gmd(self.out_dir, dump_path(self.unpack_dir, dump), blob)
+
+    def __write_font(self, job: FontJob, files: List[OutputFile]) -> None:
+        report_font(job, files, write_files(self.out_dir, files, self.outputs))
+
+    def run(self, interval: float = 0.25, debounce: float = 0.2) -> None:
+        pending: Set[str] = set()
+        last_change = 0.0
+        while True:
+            changed = self.poll()
+            if len(changed) > 0:
+                pending.update(changed)
+                last_change = time.monotonic()
+            elif len(pending) > 0 and \
+                    time.monotonic() - last_change >= debounce:
+                # Keeps watching after a failed rebuild, the next change
+                # of the sources rebuilds again
+                self.try_update('Rebuild', self.rebuild, pending)
+                pending = set()
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    watcher = Watcher(args.o[0],
+                      unpack_dir=args.u[0] if args.u else None,
+                      res_dir=args.i[0] if args.i else None,
+                      font_name=args.f[0] if args.f else None,
+                      layout_file=args.layout[0] if args.layout else None,
+                      jobs=args.jobs)
+    print(f"Watching {len(watcher.snapshot)} files, Ctrl+C to stop")
+    try:
+        watcher.run(args.interval, args.debounce)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()